@@ -1,11 +1,23 @@
-import pygame
-# from game import AI_player, Ball, Game, Player, HEIGHT, WIDTH, main, PADDLE_HEIGHT, PADDLE_WIDTH
+import argparse
 import random 
-import pickle
 import math
-from game import *
+import os
+import time
 
+import numpy as np
+
+import model_io
+from q_table import DictQTable, DenseQTable, greedy, make_q_table
+from state import StateEncoder, PairEncoder, BIN_SIZE, create_state, discretize
+from profiling import NullProfiler, PhaseProfiler
+from telemetry import MetricsWriter, episode_record
+from frame_skip import FrameSkip, PADDLE_STEPS, POOLS
+from physics import Game, Paddle, FRAME_DT, UP, DOWN, STAY, make_rng, HEIGHT, WIDTH, PADDLE_HEIGHT, PADDLE_WIDTH, LEFT_PADDLE_X, RIGHT_PADDLE_X, PADDLE_START_Y
+
+# action names, for model files; agents and paddles use their indices
+# (physics.UP, DOWN, STAY)
 ACTIONS = ["up", "down"]
+NULL_PROFILER = NullProfiler()
 # ACTIONS = ["up", "down", "stay"]
 
 GAME_SPEED = 20
@@ -14,8 +26,19 @@ distance = lambda pt1, pt2: math.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**
 
 
 class Q_learning():
-    def __init__(self, speed, epsilon=1.0, alpha=0.5, gamma=0.9):
-        self.q = {}
+    def __init__(self, speed, epsilon=1.0, alpha=0.5, gamma=0.9, backend="dict", encoder=None, seed=None, max_states=None, dtype=np.float32, bin_size=BIN_SIZE):
+        # backend: "dict" keyed by packed state and action or "dense" NumPy array
+        # seed: exploration and tie-breaks get their own RNG (None: global random)
+        # max_states: keep only this many states, least recently updated out
+        # dtype: the dense table's value type (np.float16 halves its memory)
+        # bin_size: pixels per bin of the states the agent is trained on
+        # (a given encoder's wins)
+        if backend == "dense" and encoder is None:
+            encoder = StateEncoder(bin_size)
+
+        self.q = make_q_table(backend, ACTIONS, encoder, max_states, dtype)
+        self.bin_size = encoder.bin_size if encoder else bin_size
+        self.rng = make_rng(seed)
         self.alpha = alpha
         self.gamma = gamma
         self.speed = speed
@@ -23,56 +46,110 @@ class Q_learning():
         self.epsilon = epsilon
         self.epsilon_decay = 0.995
         self.min_epsilon = 0.05
+        # sum of the rewards update() has been given, for telemetry;
+        # train() zeroes it every episode
+        self.episode_reward = 0
         
     
+    def __setstate__(self, state):
+        # pickles from before packed keys carry {(state tuple, "up"): value},
+        # the oldest as a plain dict rather than a DictQTable
+        q = state["q"]
+        if type(q) is dict or (isinstance(q, DictQTable) and "n_actions" not in q.__dict__):
+            state["q"] = DictQTable.from_legacy(ACTIONS, q.items())
+
+        # the oldest ones also predate these
+        state.setdefault("speed", None)
+        state.setdefault("epsilon_decay", 0.995)
+        state.setdefault("min_epsilon", 0.05)
+        state.setdefault("rng", random)
+        state.setdefault("episode_reward", 0)
+        state.setdefault("bin_size", BIN_SIZE)
+
+        self.__dict__.update(state)
+
+    def __getstate__(self):
+        # the global random module can't be pickled; it is the default anyway
+        state = self.__dict__.copy()
+        if state["rng"] is random:
+            del state["rng"]
+
+        return state
+
+    def save(self, path, items=None, value_dtype="<f4"):
+        # items: only write these ((state, action index), value) pairs (checkpoint deltas)
+        # value_dtype: "<f8" keeps values exact, for checkpoints; "<f2" and
+        # "i1" (int8, scaled) make smaller files
+        header = {
+            "alpha": self.alpha,
+            "gamma": self.gamma,
+            "speed": self.speed,
+            "epsilon": self.epsilon,
+            "epsilon_decay": self.epsilon_decay,
+            "min_epsilon": self.min_epsilon,
+            "bin_size": self.bin_size,
+            "default": self.q.default,
+        }
+        items = self.q.entries() if items is None else items
+        model_io.write_model(path, header, ACTIONS, items, value_dtype, self.q.visit_count)
+
+    @classmethod
+    def load(cls, path, backend="dict", seed=None, max_states=None):
+        header, arrays = model_io.read_sections(path)
+
+        encoder = StateEncoder(header["bin_size"]) if backend == "dense" else None
+        agent = cls(header["speed"], header["epsilon"], header["alpha"], header["gamma"], backend, encoder, seed, max_states, bin_size=header["bin_size"])
+        agent.epsilon_decay = header["epsilon_decay"]
+        agent.min_epsilon = header["min_epsilon"]
+
+        if header.get("default", 0) and backend == "dense":
+            raise ValueError(f"{path}: pruned with a merged default, which the dense backend can't hold")
+
+        agent.q.default = header.get("default", 0)
+        model_io.load_rows(agent.q, header, arrays)
+
+        return agent
+
+    def prune(self, min_visits=None, merge=False):
+        # see DictQTable.prune; -> number of entries dropped
+        return self.q.prune(min_visits, merge)
+
     def ensure_state_actions(self, state):
-        for a in ACTIONS:
-            self.q.setdefault((tuple(state), a), 0)
+        self.q.ensure(state)
 
     def update(self, old_state, new_state, reward, action):
-        self.ensure_state_actions(old_state)
-        self.ensure_state_actions(new_state)
-        
-        old_q = self.get_q(old_state, action)
-        future_rewards = self.best_future_reward(new_state)
-        # print("future rewards: ", future_rewards)
-        self.update_q(old_state, action, reward, old_q, future_rewards)
+        self.episode_reward += reward
+        self.q.td_update(old_state, action, reward, new_state, self.alpha, self.gamma)
+
+    def update_batch(self, states, actions, rewards, next_states, dones, weights=None):
+        # arrays of transitions, see replay.py
+        return self.q.td_update_batch(states, actions, rewards, next_states, dones, self.alpha, self.gamma, weights)
         
     
     def get_q(self, s, a):
-        key = (tuple(s), a)
-        
-        if key in self.q:
-            return self.q[key]
-
-        else:
-            return 0
+        return self.q.get_q(s, a)
     
     def update_q(self, s, a, reward, old_q, future_rewards):
-        # print("action in update q: ", a)
-        self.q[(tuple(s), a)] = old_q + self.alpha * (reward + self.gamma * future_rewards - old_q)
+        self.q.set_q(s, a, old_q + self.alpha * (reward + self.gamma * future_rewards - old_q))
     
     def best_future_reward(self, s):
-        q_values = []
-        
-        for action in ACTIONS:
-            # key = (self.apply_action(s, action), action)
-            key = (tuple(s), action)
-            
-            q_values.append(self.q[key] if key in self.q else 0)
-        
-        return max(q_values)
+        return max(self.q.q_values(s))
+
+    def best_future_rewards(self, states):
+        # best_future_reward over an (n, 6) array of states, or a 1-D array
+        # of packed keys (dict backend) or StateEncoder indices (dense)
+        return self.q.q_values_many(states).max(axis=1)
 
     def apply_action(self, s, a):
         new_state = list(s).copy()
         
-        if a == "up":
+        if a == UP:
             new_state[0] -= self.speed
             
-        elif a == "down":
+        elif a == DOWN:
             new_state[0] += self.speed
         
-        elif a == "stay":
+        elif a == STAY:
             pass
         
         return tuple(new_state)
@@ -83,16 +160,10 @@ class Q_learning():
             self.epsilon *= self.epsilon_decay
     
     def choose_action(self, state):
-        if self.epsilon and random.random() <= self.epsilon:
-            return random.choice(ACTIONS)
+        if self.epsilon and self.rng.random() <= self.epsilon:
+            return self.rng.randrange(len(ACTIONS))
 
-        state = tuple(state)
-        
-        up_key = (state, "up")
-        down_key = (state, "down")
-                
-        up_q = self.q[up_key] if up_key in self.q else 0
-        down_q = self.q[down_key] if down_key in self.q else 0
+        up_q, down_q = self.q.q_values(state)
         
         # stay_state = (state, "stay")
         
@@ -123,36 +194,35 @@ class Q_learning():
         
         if up_q > down_q:
             # print("up")
-            return "up"
+            return UP
 
         elif down_q > up_q:
             # print("down")
-            return "down"
+            return DOWN
         
         else:
-            return random.choice(ACTIONS)
+            return self.rng.randrange(len(ACTIONS))
+
+    def choose_actions(self, states):
+        # choose_action over a batch of states -> action indices; states as
+        # best_future_rewards takes them.
+        # The NumPy generator is seeded from self.rng,
+        # so seeded agents stay reproducible.
+        rng = np.random.default_rng(self.rng.getrandbits(64))
+        actions = greedy(self.q.q_values_many(states), rng)
+
+        if self.epsilon:
+            explore = rng.random(len(actions)) <= self.epsilon
+            actions[explore] = rng.integers(0, len(ACTIONS), int(explore.sum()))
+
+        return actions
 
 distance = lambda pt1, pt2: math.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
 # center_point = lambda pt1, pt2: ((pt1[0] + pt2[0]) / 2, (pt1[1] + pt2[1]) / 2)
 # center_point = lambda pt1: (pt1[0] + PADDLE_WIDTH, pt1[1] + PADDLE_HEIGHT // 2)
 center_point = lambda pt1, pt2: ((pt1[0] + pt2[0]) / 2, (pt1[1] + pt2[1]) / 2)
 
-def discretize(val, bin_size):
-    return round(val / bin_size)
-
-def create_state(p, opp, ball):
-    sign = lambda val: 1 if val > 0 else -1
-    return (
-        discretize(p.y, 10),
-        discretize(p.y - ball.y, 10),
-        # discretize(distance(center_point((p.x, p.y)), (ball.x, ball.y)), 1),
-        
-        discretize(ball.x, 10),
-        discretize(ball.y, 10),
-        sign(ball.Vx),
-        sign(ball.Vy),
-        
-    )
+# create_state and discretize live in state.py, shared with game.py
 
 
 distance = lambda pt1, pt2: math.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
@@ -173,174 +243,363 @@ def get_hit_zone(paddle_rect, ball_y):
         return "bottom"
 
 
-def train(n, draw=False):
-    left_q = Q_learning(GAME_SPEED)
-    right_q = Q_learning(GAME_SPEED)
+LEFT_MODEL_PATH = "left_paddle_new_change_state2.qtab"
+RIGHT_MODEL_PATH = "right_paddle_new_change_state2.qtab"
+
+
+def load_or_create(path, seed=None, max_states=None):
+    if os.path.exists(path):
+        return Q_learning.load(path, seed=seed, max_states=max_states)
+
+    return Q_learning(GAME_SPEED, seed=seed, max_states=max_states)
+
+
+def derive_seed(seed, key):
+    # a distinct, reproducible seed per episode/agent of a seeded run
+    return None if seed is None else f"{seed}:{key}"
+
+
+def game_encoder(game, bin_size, right_bin_size=None):
+    # the PairEncoder kept on a game, made again only if the bins change
+    right_bin_size = right_bin_size or bin_size
+    encoder = getattr(game, "encoder", None)
+    if encoder is None or encoder.bin_size != bin_size or encoder.right_bin_size != right_bin_size:
+        encoder = game.encoder = PairEncoder(bin_size, right_bin_size)
+
+    return encoder
+
+
+def episode_paddles(game, speed):
+    paddles = getattr(game, "episode_paddles", None)
+    if paddles is None or paddles[0].speed != speed:
+        paddles = game.episode_paddles = (
+            Paddle(speed, 1, LEFT_PADDLE_X, PADDLE_START_Y), # left paddle
+            Paddle(speed, 2, RIGHT_PADDLE_X, PADDLE_START_Y), # right paddle
+        )
+    else:
+        for paddle in paddles:
+            paddle.reset()
+
+    return paddles
+
+
+def play_episode(left_q, right_q, profiler=NULL_PROFILER, seed=None, game=None, speed=GAME_SPEED, repeat_action=REPEAT_ACTION, bin_size=BIN_SIZE, right_bin_size=None):
+    # game: the previous episode's Game, reset and played again (it keeps
+    # the speed it was made with)
+    # speed, repeat_action, bin_size: ball and paddle speed, paddle steps
+    # per action, pixels per state bin
+    # right_bin_size: the right agent's bins, if not the same as the left's
+    lap = profiler.lap
     
-    with open("left_paddle_new_change_state2.pkl", "rb") as f:
-        left_q = pickle.load(f)
+    if game is None:
+        game = Game(speed, FRAME_DT, seed)
+    else:
+        game.reset(seed)
     
-    with open("right_paddle_new_change_state2.pkl", "rb") as f:
-        right_q = pickle.load(f)
+    ball = game.ball
+    encoder = game_encoder(game, bin_size, right_bin_size)
     
-    for i in range(n):
-        print(f"Training AI on game No. {i}...")
-        # screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    # the paddles that learn; game.update_all() still bounces the ball off
+    # the game's own, which never move. Kept on the game and reset with it
+    p1, p2 = episode_paddles(game, speed * game.dt)
+    
+
+    # p1.screen = screen
+    # p2.screen = screen
+    # ball.screen = screen
+    
+    
+    while True:
+        ball.check_collisions(p1.rect, p2.rect)
+        ball.update(p1.rect, p2.rect)
+        lap("physics")
         
-        game = Game(GAME_SPEED, None)
-        ball = game.ball
-        dt = game.dt
+        # packed keys for both paddles in one go; the ball moves again
+        # before the next step, so new_state can't be reused as state
+        state1, state2 = encoder.keys(p1, p2, ball)
+        # print("STATE: ", state1)
+        lap("encode")
         
-        p1 = AI_player(GAME_SPEED * dt, None, 1, 30, HEIGHT // 2 - 100) # left paddle
-        p2 = AI_player(GAME_SPEED * dt, None, 2, 930, HEIGHT // 2 - 100) # right paddle
+        old_p1_point = (p1.x, p1.y)
+        old_p2_point = (p2.x, p2.y)
         
-    
-        # p1.screen = screen
-        # p2.screen = screen
-        # ball.screen = screen
         
+        action1 = left_q.choose_action(state1)
+        action2 = right_q.choose_action(state2)
+        lap("act")
         
-        while True:
-            ball.check_collisions(p1.rect, p2.rect)
-            ball.update(p1.rect, p2.rect, draw=False)
-            
-            state1 = create_state(p1, p2, ball)
-            state2 = create_state(p2, p1, ball)
-            # print("STATE: ", state1)
-            
-            old_p1_point = (p1.x, p1.y)
-            old_p2_point = (p2.x, p2.y)
-            
-            
-            action1 = left_q.choose_action(state1)
-            action2 = right_q.choose_action(state2)
-            
-            p1.move(action1, REPEAT_ACTION)
-            p2.move(action2, REPEAT_ACTION)
+        p1.move(action1, repeat_action)
+        p2.move(action2, repeat_action)
 
-            ball.update(p1.rect, p2.rect, draw=False) # ADD FALSE HERE
-            new_state1 = create_state(p1, p2, ball)
-            new_state2 = create_state(p2, p1, ball)
-            
-            paddle_hit = ball.check_collisions(p1.rect, p2.rect)
-            
-            # Check for win
-            if game.win() == 1:
-                left_q.update(state1, new_state1, 2, action1)
-                right_q.update(state2, new_state2, -2, action2)
-                break
-            
-            elif game.win() == 2:
-                left_q.update(state1, new_state1, -2, action1)
-                right_q.update(state2, new_state2, 2, action2)
-                break
-            
-            # Check for paddle hit
-            # left paddle hit/miss
-            
-            if paddle_hit == 1:
-                # if get_hit_zone(p1.rect, ball.y) in ["top", "bottom"]:
-                #     # print("top/bottom")
-                    
-                #     left_q.update(state1, new_state1, 0.5, action1)
-                
-                # else:
-                #     # print("middle")
-                    
-                left_q.update(state1, new_state1, 1, action1)
-                
-                
-            if ball.did_hit_sides() == -1:
-                left_q.update(state1, new_state1, -1, action1)
-                right_q.update(state2, new_state2, 1, action2)
+        ball.update(p1.rect, p2.rect)
+        lap("physics")
+        new_state1, new_state2 = encoder.keys(p1, p2, ball)
+        lap("encode")
+        
+        paddle_hit = ball.check_collisions(p1.rect, p2.rect)
+        lap("physics")
+        
+        # Check for win
+        if game.win() == 1:
+            left_q.update(state1, new_state1, 2, action1)
+            right_q.update(state2, new_state2, -2, action2)
+            lap("learn")
+            profiler.step()
+            break
+        
+        elif game.win() == 2:
+            left_q.update(state1, new_state1, -2, action1)
+            right_q.update(state2, new_state2, 2, action2)
+            lap("learn")
+            profiler.step()
+            break
+        
+        # Check for paddle hit
+        # left paddle hit/miss
+        
+        if paddle_hit == 1:
+            # if get_hit_zone(p1.rect, ball.y) in ["top", "bottom"]:
+            #     # print("top/bottom")
                 
+            #     left_q.update(state1, new_state1, 0.5, action1)
             
-            if paddle_hit == 2:
-                # if get_hit_zone(p2.rect, ball.y) in ["top", "bottom"]:
-                    # print("top/bottom")
-                #     right_q.update(state2, new_state2, 0.5, action2)
+            # else:
+            #     # print("middle")
                 
-                # else:
-                    # print("middle")
-                right_q.update(state2, new_state2, 1, action2)
-                    
-            if ball.did_hit_sides() == 1:
-                right_q.update(state2, new_state2, -1, action2)
-                left_q.update(state1, new_state1, 1, action1)
-                
-            
-            ball_point = (ball.x, ball.y)
-            did_hit_left_paddle = False
-            did_hit_right_paddle = False
+            left_q.update(state1, new_state1, 1, action1)
             
             
+        if ball.did_hit_sides() == -1:
+            left_q.update(state1, new_state1, -1, action1)
+            right_q.update(state2, new_state2, 1, action2)
             
-
-            if ball.x <= WIDTH // 2 and not did_hit_left_paddle: # left paddle
-                if paddle_hit == 1:
-                    did_hit_left_paddle = True
-            
-                if did_hit_right_paddle:
-                    did_hit_right_paddle = False
+        
+        if paddle_hit == 2:
+            # if get_hit_zone(p2.rect, ball.y) in ["top", "bottom"]:
+                # print("top/bottom")
+            #     right_q.update(state2, new_state2, 0.5, action2)
             
-                new_center = center_point((p1.x, p1.y), ball_point)
-                old_center = center_point(old_p1_point, ball_point)
-                
-                # new_center = center_point((p1.x, p1.y))
-                # old_center = center_point(old_p1_point)
-                
-                if distance(new_center, ball_point) < distance(old_center, ball_point):
-                    left_q.update(state1, new_state1, 0.2, action1)
+            # else:
+                # print("middle")
+            right_q.update(state2, new_state2, 1, action2)
                 
-                else:
-                    left_q.update(state1, new_state1, -0.2, action1)
-            
-            
-            if ball.x >= WIDTH // 2 and not did_hit_right_paddle: # right paddle
-                if paddle_hit == 2:
-                    did_hit_right_paddle = True
-                    
-                if did_hit_left_paddle:
-                    did_hit_left_paddle = False
+        if ball.did_hit_sides() == 1:
+            right_q.update(state2, new_state2, -1, action2)
+            left_q.update(state1, new_state1, 1, action1)
+        
+        lap("learn")
             
-                
-                new_center = center_point((p2.x, p2.y), ball_point)
-                old_center = center_point(old_p2_point, ball_point)
-                
-                # new_center = center_point((p2.x, p2.y))
-                # old_center = center_point(old_p2_point)
-                
-                if distance(new_center, ball_point) < distance(old_center, ball_point):
-                    right_q.update(state2, new_state2, 0.2, action2)
-                
-                else:
-                    right_q.update(state2, new_state2, -0.2, action2)
-                    
-                
+        
+        ball_point = (ball.x, ball.y)
+        did_hit_left_paddle = False
+        did_hit_right_paddle = False
+        
+        
+        
+
+        if ball.x <= WIDTH // 2 and not did_hit_left_paddle: # left paddle
+            if paddle_hit == 1:
+                did_hit_left_paddle = True
+        
+            if did_hit_right_paddle:
+                did_hit_right_paddle = False
+        
+            new_center = center_point((p1.x, p1.y), ball_point)
+            old_center = center_point(old_p1_point, ball_point)
             
+            # new_center = center_point((p1.x, p1.y))
+            # old_center = center_point(old_p1_point)
             
+            if distance(new_center, ball_point) < distance(old_center, ball_point):
+                left_q.update(state1, new_state1, 0.2, action1)
             
+            else:
+                left_q.update(state1, new_state1, -0.2, action1)
+        
+        
+        if ball.x >= WIDTH // 2 and not did_hit_right_paddle: # right paddle
+            if paddle_hit == 2:
+                did_hit_right_paddle = True
+                
+            if did_hit_left_paddle:
+                did_hit_left_paddle = False
+        
             
+            new_center = center_point((p2.x, p2.y), ball_point)
+            old_center = center_point(old_p2_point, ball_point)
             
+            # new_center = center_point((p2.x, p2.y))
+            # old_center = center_point(old_p2_point)
             
+            if distance(new_center, ball_point) < distance(old_center, ball_point):
+                right_q.update(state2, new_state2, 0.2, action2)
             
+            else:
+                right_q.update(state2, new_state2, -0.2, action2)
+                
             
-            # pygame.display.set_caption("Pong AI")
-            # pygame.display.flip()
+        
+        
+        
+        
+        
+        
+        
+        
+        # pygame.display.set_caption("Pong AI")
+        # pygame.display.flip()
 
-            # screen.fill((0, 0, 0))
-            
-            
-            # game.p1 = p1
-            # game.p2 = p2
-            p1.update(draw=False)
-            p2.update(draw=False)
-            
-            # game.screen = screen
-            game.update_all(draw=False)
-            pygame.event.pump()
-            
-            # pygame.display.flip()
+        # screen.fill((0, 0, 0))
+        
+        
+        # game.p1 = p1
+        # game.p2 = p2
+        # distance shaping above, including its Q updates
+        lap("reward")
+        
+        p1.update()
+        p2.update()
+        
+        game.update_all()
+        lap("physics")
+        profiler.step()
+        
+        # pygame.display.flip()
+
+    return game
+
+
+def shaping_reward(paddle, old_point, ball):
+    # play_episode's distance shaping: did the paddle get closer to the ball
+    ball_point = (ball.x, ball.y)
+    new_center = center_point((paddle.x, paddle.y), ball_point)
+    old_center = center_point(old_point, ball_point)
+
+    return 0.2 if distance(new_center, ball_point) < distance(old_center, ball_point) else -0.2
+
+
+def play_skipped_episode(left_q, right_q, frame_skip, profiler=NULL_PROFILER, seed=None, game=None, bin_size=BIN_SIZE, right_bin_size=None):
+    # play_episode's rewards on FrameSkip dynamics, the same ones game.py
+    # plays with. frame_skip: FrameSkip settings (skip, paddle_steps, pool)
+    lap = profiler.lap
+
+    if game is None:
+        game = Game(GAME_SPEED, FRAME_DT, seed)
+    else:
+        game.reset(seed)
+
+    env = FrameSkip(game, packed=True, encoder=game_encoder(game, bin_size, right_bin_size), **frame_skip)
+    p1, p2, ball = game.p1, game.p2, game.ball
+    state1, state2 = env.observe()
+
+    while True:
+        action1 = left_q.choose_action(state1)
+        action2 = right_q.choose_action(state2)
+        lap("act")
+
+        old_p1_point = (p1.x, p1.y)
+        old_p2_point = (p2.x, p2.y)
+        new_state1, new_state2, paddle_hit, side = env.step(action1, action2)
+        lap("physics")
+
+        winner = game.win()
+        if winner:
+            left_q.update(state1, new_state1, 2 if winner == 1 else -2, action1)
+            right_q.update(state2, new_state2, 2 if winner == 2 else -2, action2)
+            lap("learn")
+            profiler.step()
+            break
+
+        if paddle_hit == 1:
+            left_q.update(state1, new_state1, 1, action1)
+
+        if paddle_hit == 2:
+            right_q.update(state2, new_state2, 1, action2)
+
+        if side:
+            left_q.update(state1, new_state1, side, action1)
+            right_q.update(state2, new_state2, -side, action2)
+
+        if ball.x <= WIDTH // 2:
+            left_q.update(state1, new_state1, shaping_reward(p1, old_p1_point, ball), action1)
+
+        if ball.x >= WIDTH // 2:
+            right_q.update(state2, new_state2, shaping_reward(p2, old_p2_point, ball), action2)
+
+        lap("learn")
+        profiler.step()
+
+        # after a goal the next decision starts from the serve
+        if side:
+            new_state1, new_state2 = env.observe()
+
+        state1, state2 = new_state1, new_state2
+        lap("encode")
+
+    return game
+
+
+def train(n, draw=False, left_q=None, right_q=None, profiler=None, checkpointer=None, seed=None, replay=None, frame_skip=None, max_states=None, metrics=None, multistep=None):
+    # profiler: a profiling.PhaseProfiler to time each phase of every episode
+    # checkpointer: a checkpoint.Checkpointer; training picks up from its
+    # latest checkpoint when there is one
+    # seed: every episode's serves come from derive_seed(seed, i) and new
+    # agents explore with their own seeded rng, so a run replays exactly
+    # replay: wraps each agent to learn from a replay buffer instead of
+    # online, e.g. lambda agent: ReplayLearner(agent, ReplayBuffer(100000))
+    # frame_skip: FrameSkip settings, e.g. {"skip": 4}, to train on the
+    # game's dynamics (play_skipped_episode) instead of play_episode's
+    # max_states: bound each loaded or new agent's table to this many states
+    # metrics: a telemetry.MetricsWriter to get one record per episode
+    # multistep: like replay, wraps each agent to learn from n-step returns
+    # or Q(lambda) traces, e.g. lambda agent: WatkinsLearner(agent, 0.8)
+    # left_q/right_q can be any agents with Q_learning's choose_action,
+    # update and decay_epslion (approx.py); states come in their bin_size
+    profiler = profiler or NULL_PROFILER
+    start = 0
+    
+    if checkpointer and checkpointer.exists():
+        # the same kind of table as the agents passed in, or the ones
+        # load_or_create() below would have made
+        backend = "dense" if left_q is not None and isinstance(left_q.q, DenseQTable) else "dict"
+        if max_states is None and left_q is not None:
+            max_states = getattr(left_q.q, "max_states", None)
+
+        start, left_q, right_q = checkpointer.resume(backend, max_states)
+        print(f"Resuming from game No. {start}")
+    
+    if left_q is None:
+        left_q = load_or_create(LEFT_MODEL_PATH, derive_seed(seed, "left"), max_states)
+
+    if right_q is None:
+        right_q = load_or_create(RIGHT_MODEL_PATH, derive_seed(seed, "right"), max_states)
+    
+    game = None
+    left, right = left_q, right_q
+    if replay:
+        left, right = replay(left_q), replay(right_q)
+    elif multistep:
+        left, right = multistep(left_q), multistep(right_q)
+    
+    for i in range(start, n):
+        print(f"Training AI on game No. {i}...")
+        profiler.begin_episode(left_q, right_q)
+        left_q.episode_reward = right_q.episode_reward = 0
+        episode_start = time.perf_counter()
+        if frame_skip is None:
+            game = play_episode(left, right, profiler, derive_seed(seed, i), game, bin_size=left_q.bin_size, right_bin_size=right_q.bin_size)
+        else:
+            game = play_skipped_episode(left, right, frame_skip, profiler, derive_seed(seed, i), game, left_q.bin_size, right_q.bin_size)
+        profiler.end_episode(i, game, left_q, right_q)
+
+        if metrics:
+            metrics.write(episode_record(i, game, left_q, right_q, time.perf_counter() - episode_start))
+        
+        # replay learners (and agents with a buffer of their own) mark
+        # where the episode ended
+        for agent in (left, right):
+            if hasattr(agent, "end_episode"):
+                agent.end_episode()
         
         # print(len(right_q.q), len(left_q.q))
             
@@ -348,6 +607,13 @@ def train(n, draw=False):
         left_q.decay_epslion()
         right_q.decay_epslion()
         
+        if checkpointer:
+            checkpointer.maybe_save(i + 1, left_q, right_q)
+        
+    # resumed at or past n: nothing was trained, and the checkpoint already
+    # holds more than n games' worth
+    if checkpointer and start < n:
+        checkpointer.save(n, left_q, right_q)
         
     return left_q, right_q
 
@@ -355,13 +621,82 @@ def train(n, draw=False):
 
 
 if __name__ == "__main__":
-    left, right = train(100)
+    parser = argparse.ArgumentParser(description="Self-play Q-learning training")
+    parser.add_argument("games", type=int, nargs="?", default=100)
+    parser.add_argument("--profile", help="write a per-episode phase timing report here (.json or .csv)")
+    parser.add_argument("--checkpoint-dir", help="checkpoint here and resume from it if it has one")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="games between checkpoints")
+    parser.add_argument("--checkpoint-seconds", type=float, default=None, help="also checkpoint after this many seconds")
+    parser.add_argument("--compact-every", type=int, default=10, help="checkpoints between full snapshots")
+    parser.add_argument("--seed", help="make the run reproducible: same seed, same games")
+    parser.add_argument("--replay", type=int, metavar="CAPACITY", help="learn from a replay buffer of this many transitions")
+    parser.add_argument("--replay-batch", type=int, default=64)
+    parser.add_argument("--replay-every", type=int, default=4, help="transitions between replayed batches")
+    parser.add_argument("--prioritized", action="store_true", help="prioritized instead of uniform replay")
+    parser.add_argument("--frame-skip", type=int, metavar="FRAMES", help="train on the game's dynamics, deciding every FRAMES frames")
+    parser.add_argument("--paddle-steps", type=int, default=PADDLE_STEPS, help="paddle steps per frame with --frame-skip")
+    parser.add_argument("--pool", choices=POOLS, default="last", help="state after a decision with --frame-skip")
+    parser.add_argument("--max-states", type=int, help="keep at most this many states, dropping the least recently updated")
+    parser.add_argument("--metrics", help="append a JSONL record per game here (watch it with telemetry.py)")
+    parser.add_argument("--n-step", type=int, metavar="N", help="learn from N-step returns")
+    parser.add_argument("--lam", type=float, metavar="LAMBDA", help="learn with Watkins's Q(lambda) traces")
+    parser.add_argument("--agent", choices=["table", "tiles", "mlp"], default="table",
+                        help="Q-table, or a function approximator from approx.py (saved next to the .qtab as .tiles.npz/.mlp.npz)")
+    args = parser.parse_args()
     
-    with open("left_paddle_new_change_state2.pkl", "wb") as f:
-        pickle.dump(left, f)
-        
+    profiler = PhaseProfiler() if args.profile else None
+    
+    multistep = None
+    if args.n_step or args.lam is not None:
+        if args.replay or args.agent != "table" or (args.n_step and args.lam is not None):
+            parser.error("--n-step and --lam are for the online Q-table agent, one at a time")
+
+        from multistep import NStepLearner, WatkinsLearner
+        multistep = (lambda agent: NStepLearner(agent, args.n_step)) if args.n_step else (lambda agent: WatkinsLearner(agent, args.lam))
+    
+    left_q = right_q = None
+    if args.agent != "table":
+        if args.checkpoint_dir or args.max_states:
+            parser.error("--checkpoint-dir and --max-states are for the Q-table agent")
+
+        from approx import AGENTS, approx_path, load_agent
+        left_path, right_path = approx_path(LEFT_MODEL_PATH, args.agent), approx_path(RIGHT_MODEL_PATH, args.agent)
+        left_q, right_q = [
+            load_agent(path, derive_seed(args.seed, side)) if os.path.exists(path) else AGENTS[args.agent](seed=derive_seed(args.seed, side))
+            for path, side in ((left_path, "left"), (right_path, "right"))
+        ]
+    
+    checkpointer = None
+    if args.checkpoint_dir:
+        from checkpoint import Checkpointer
+        checkpointer = Checkpointer(args.checkpoint_dir, args.checkpoint_every, args.checkpoint_seconds, args.compact_every)
+    
+    replay = None
+    if args.replay:
+        from replay import ReplayBuffer, ReplayLearner
+        replay = lambda agent: ReplayLearner(agent, ReplayBuffer(args.replay, args.prioritized, seed=args.seed), args.replay_batch, args.replay_every)
     
-    with open("right_paddle_new_change_state2.pkl", "wb") as f:
-        pickle.dump(right, f)
+    frame_skip = None
+    if args.frame_skip:
+        frame_skip = {"skip": args.frame_skip, "paddle_steps": args.paddle_steps, "pool": args.pool}
+    
+    metrics = MetricsWriter(args.metrics) if args.metrics else None
+
+    try:
+        left, right = train(args.games, left_q=left_q, right_q=right_q, profiler=profiler, checkpointer=checkpointer, seed=args.seed, replay=replay, frame_skip=frame_skip, max_states=args.max_states, metrics=metrics, multistep=multistep)
+    finally:
+        if metrics:
+            metrics.close()
+    
+    if profiler:
+        profiler.write(args.profile)
+        print(profiler.summary())
+    
+    if args.agent == "table":
+        left.save(LEFT_MODEL_PATH)
+        right.save(RIGHT_MODEL_PATH)
+    else:
+        left.save(left_path)
+        right.save(right_path)
         
         
\ No newline at end of file
@@ -0,0 +1,332 @@
+import json
+import random
+
+import numpy as np
+
+from ai import ACTIONS
+from physics import make_rng, WIDTH, HEIGHT, PADDLE_HEIGHT
+from replay import ReplayBuffer, ReplayLearner
+from state import BALL_X_MARGIN, BALL_Y_MARGIN, unpack_state
+
+# Value-function approximation agents: drop-in replacements for Q_learning in
+# play_episode() and train() (choose_action, update, decay_epslion), whose
+# memory is fixed up front and who generalize to states they haven't seen.
+#
+#   TileCodingAgent   linear Q over overlapping tilings of the state
+#   MLPAgent          a small NumPy MLP, DQN-style: replay and a target network
+#
+# They see the same create_state fields as the tables, but in pixel bins
+# (bin_size 1) by default, so the inputs are as good as continuous.
+# Saved as .npz: a JSON header plus the weights.
+
+APPROX_BIN_SIZE = 1
+
+# the four position fields' ranges in pixels, for scaling them to [0, 1]
+FIELD_RANGES = (
+    (0, HEIGHT - PADDLE_HEIGHT),            # paddle y
+    (-HEIGHT, HEIGHT),                      # paddle y - ball y
+    (-BALL_X_MARGIN, WIDTH + BALL_X_MARGIN),  # ball x
+    (-BALL_Y_MARGIN, HEIGHT + BALL_Y_MARGIN), # ball y
+)
+
+
+def numpy_rng(seed):
+    # any seed random.Random takes, like the rest of a seeded run
+    return np.random.default_rng(None if seed is None else random.Random(seed).getrandbits(64))
+
+
+class ApproxAgent():
+    kind = None
+
+    def __init__(self, epsilon=1.0, alpha=0.1, gamma=0.9, seed=None, bin_size=APPROX_BIN_SIZE):
+        self.rng = make_rng(seed)
+        self.alpha = alpha
+        self.gamma = gamma
+        self.bin_size = bin_size
+
+        self.epsilon = epsilon
+        self.epsilon_decay = 0.995
+        self.min_epsilon = 0.05
+        self.episode_reward = 0
+
+        lo = np.array([r[0] for r in FIELD_RANGES], dtype=np.float64)
+        hi = np.array([r[1] for r in FIELD_RANGES], dtype=np.float64)
+        # field * bin_size -> pixels -> [0, 1]
+        self.scale = bin_size / (hi - lo)
+        self.shift = -lo / (hi - lo)
+
+    def __getstate__(self):
+        # the global random module can't be pickled; it is the default anyway
+        state = self.__dict__.copy()
+        if state["rng"] is random:
+            del state["rng"]
+
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("rng", random)
+        self.__dict__.update(state)
+
+    def positions(self, state):
+        # a create_state tuple or pack_state() key -> the four position
+        # fields in [0, 1] and the two signs
+        if type(state) is int:
+            state = unpack_state(state)
+
+        x = np.clip(np.array(state[:4], dtype=np.float64) * self.scale + self.shift, 0, 1)
+        return x, state[4], state[5]
+
+    def decay_epslion(self):
+        if self.epsilon and self.epsilon > self.min_epsilon:
+            self.epsilon *= self.epsilon_decay
+
+    def choose_action(self, state):
+        if self.epsilon and self.rng.random() <= self.epsilon:
+            return self.rng.randrange(len(ACTIONS))
+
+        values = self.q_values(state)
+        best = values.max()
+        ties = np.flatnonzero(values == best)
+        return int(ties[0]) if len(ties) == 1 else int(ties[self.rng.randrange(len(ties))])
+
+    def header(self):
+        return {
+            "kind": self.kind,
+            "alpha": self.alpha,
+            "gamma": self.gamma,
+            "epsilon": self.epsilon,
+            "epsilon_decay": self.epsilon_decay,
+            "min_epsilon": self.min_epsilon,
+            "bin_size": self.bin_size,
+        }
+
+    def save(self, path):
+        # written through a file object so numpy doesn't tack on ".npz"
+        with open(path, "wb") as f:
+            np.savez(f, header=np.array(json.dumps(self.header())), **self.arrays())
+
+
+class TileCodingAgent(ApproxAgent):
+    # `tilings` grids of `tiles` tiles a side over the four position fields,
+    # each shifted by a different fraction of a tile, and a separate set per
+    # combination of the two velocity signs. A state switches on one tile
+    # per tiling; Q(s, a) is the sum of their weights for a.
+    kind = "tiles"
+
+    def __init__(self, epsilon=1.0, alpha=0.1, gamma=0.9, seed=None, bin_size=APPROX_BIN_SIZE, tilings=8, tiles=8):
+        super().__init__(epsilon, alpha, gamma, seed, bin_size)
+        self.tilings = tilings
+        self.tiles = tiles
+
+        # a tiling has tiles + 1 cells a side: the shift pushes the top edge over
+        side = tiles + 1
+        self.strides = np.array([side ** 3, side ** 2, side, 1], dtype=np.int64)
+        self.tiling_size = side ** 4
+        self.sign_size = tilings * self.tiling_size
+        self.bases = np.arange(tilings, dtype=np.int64) * self.tiling_size
+
+        # the usual asymmetric shifts (1, 3, 5, 7) / tilings, so the
+        # tilings don't all line up along the diagonal
+        self.offsets = (np.arange(tilings)[:, None] * np.array([1, 3, 5, 7])[None, :] / tilings) % 1
+
+        self.weights = np.zeros((len(ACTIONS), 4 * self.sign_size), dtype=np.float32)
+        # play_episode looks each state up a few times in a row
+        self.cache = {}
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["cache"] = {}
+        return state
+
+    @property
+    def q(self):
+        # the weights, flat: what len(agent.q) in the reports counts
+        return self.weights.reshape(-1)
+
+    def active_tiles(self, state):
+        tiles = self.cache.get(state)
+        if tiles is None:
+            x, sign_x, sign_y = self.positions(state)
+            sign = (2 if sign_x > 0 else 0) + (1 if sign_y > 0 else 0)
+
+            cells = np.floor(x * self.tiles + self.offsets).astype(np.int64)
+            tiles = cells @ self.strides + self.bases + sign * self.sign_size
+
+            if len(self.cache) > 4096:
+                self.cache.clear()
+            self.cache[state] = tiles
+
+        return tiles
+
+    def q_values(self, state):
+        return self.weights[:, self.active_tiles(state)].sum(axis=1)
+
+    def td_step(self, old_state, action, reward, new_state, done=False, weight=1):
+        tiles = self.active_tiles(old_state)
+        target = reward if done else reward + self.gamma * self.q_values(new_state).max()
+        error = target - self.weights[action, tiles].sum()
+        # alpha is the step for the whole sum, shared between the tilings
+        self.weights[action, tiles] += self.alpha / self.tilings * weight * error
+        return error
+
+    def update(self, old_state, new_state, reward, action):
+        self.episode_reward += reward
+        self.td_step(old_state, action, reward, new_state)
+
+    def update_batch(self, states, actions, rewards, next_states, dones, weights=None):
+        # for replay.ReplayLearner: td_step over the rows in order
+        errors = np.empty(len(actions))
+        for i in range(len(actions)):
+            errors[i] = self.td_step(tuple(states[i].tolist()), int(actions[i]), rewards[i], tuple(next_states[i].tolist()),
+                                     dones[i], 1 if weights is None else weights[i])
+
+        return errors
+
+    def header(self):
+        return {**super().header(), "tilings": self.tilings, "tiles": self.tiles}
+
+    def arrays(self):
+        return {"weights": self.weights}
+
+    @classmethod
+    def from_saved(cls, header, arrays, seed=None):
+        agent = cls(header["epsilon"], header["alpha"], header["gamma"], seed, header["bin_size"], header["tilings"], header["tiles"])
+        agent.weights[:] = arrays["weights"]
+        return agent
+
+
+class MLPAgent(ApproxAgent):
+    # features -> tanh hidden layer -> one Q-value per action. Learning is
+    # DQN's: transitions go to a replay buffer, every `learn_every` of them
+    # a minibatch takes an Adam step towards r + gamma * max Q_target(s', .),
+    # and the target network is a copy of the weights refreshed every
+    # `target_every` steps.
+    kind = "mlp"
+    n_inputs = 6
+
+    def __init__(self, epsilon=1.0, alpha=1e-3, gamma=0.9, seed=None, bin_size=APPROX_BIN_SIZE, hidden=64,
+                 capacity=50000, batch_size=32, learn_every=4, target_every=500):
+        super().__init__(epsilon, alpha, gamma, seed, bin_size)
+        self.hidden = hidden
+        self.batch_size = batch_size
+        self.learn_every = learn_every
+        self.target_every = target_every
+
+        init = numpy_rng(seed)
+        self.params = {
+            "w1": init.normal(0, 1 / np.sqrt(self.n_inputs), (self.n_inputs, hidden)),
+            "b1": np.zeros(hidden),
+            "w2": init.normal(0, 1 / np.sqrt(hidden), (hidden, len(ACTIONS))),
+            "b2": np.zeros(len(ACTIONS)),
+        }
+        self.target = {name: p.copy() for name, p in self.params.items()}
+
+        # Adam's moment estimates
+        self.m = {name: np.zeros_like(p) for name, p in self.params.items()}
+        self.v = {name: np.zeros_like(p) for name, p in self.params.items()}
+        self.steps = 0
+
+        # seeded from self.rng like choose_actions' generators
+        buffer = ReplayBuffer(capacity, seed=None if seed is None else self.rng.getrandbits(64))
+        self.learner = ReplayLearner(self, buffer, batch_size, learn_every)
+
+    @property
+    def q(self):
+        # the weights, flat: what len(agent.q) in the reports counts
+        return np.concatenate([p.ravel() for p in self.params.values()])
+
+    def features(self, states):
+        # (n, 6) create_state fields -> positions in [0, 1], signs as -1/1
+        states = np.asarray(states, dtype=np.float64)
+        x = np.empty(states.shape)
+        x[:, :4] = np.clip(states[:, :4] * self.scale + self.shift, 0, 1)
+        x[:, 4:] = states[:, 4:]
+        return x
+
+    def forward(self, x, params):
+        h = np.tanh(x @ params["w1"] + params["b1"])
+        return h, h @ params["w2"] + params["b2"]
+
+    def q_values(self, state):
+        x, sign_x, sign_y = self.positions(state)
+        x = np.append(x, (sign_x, sign_y))
+        return self.forward(x, self.params)[1]
+
+    def update(self, old_state, new_state, reward, action):
+        # the learner stores it, adds it to episode_reward and calls
+        # update_batch when a minibatch is due
+        self.learner.update(old_state, new_state, reward, action)
+
+    def end_episode(self):
+        self.learner.end_episode()
+
+    def update_batch(self, states, actions, rewards, next_states, dones, weights=None):
+        x = self.features(states)
+        h, q = self.forward(x, self.params)
+        next_q = self.forward(self.features(next_states), self.target)[1].max(axis=1)
+
+        rows = np.arange(len(actions))
+        errors = rewards + self.gamma * np.where(dones, 0, next_q) - q[rows, actions]
+
+        # the Huber loss's gradient: errors past 1 count as 1
+        grad_q = np.zeros_like(q)
+        grad_q[rows, actions] = -np.clip(errors, -1, 1) * (1 if weights is None else weights) / len(actions)
+
+        grad_h = (grad_q @ self.params["w2"].T) * (1 - h ** 2)
+        grads = {
+            "w1": x.T @ grad_h,
+            "b1": grad_h.sum(axis=0),
+            "w2": h.T @ grad_q,
+            "b2": grad_q.sum(axis=0),
+        }
+        self.adam(grads)
+
+        if self.steps % self.target_every == 0:
+            for name, p in self.params.items():
+                self.target[name][:] = p
+
+        return errors
+
+    def adam(self, grads, beta1=0.9, beta2=0.999, eps=1e-8):
+        self.steps += 1
+        correction = np.sqrt(1 - beta2 ** self.steps) / (1 - beta1 ** self.steps)
+
+        for name, grad in grads.items():
+            self.m[name] = beta1 * self.m[name] + (1 - beta1) * grad
+            self.v[name] = beta2 * self.v[name] + (1 - beta2) * grad ** 2
+            self.params[name] -= self.alpha * correction * self.m[name] / (np.sqrt(self.v[name]) + eps)
+
+    def header(self):
+        return {**super().header(), "hidden": self.hidden, "batch_size": self.batch_size,
+                "learn_every": self.learn_every, "target_every": self.target_every}
+
+    def arrays(self):
+        return self.params
+
+    @classmethod
+    def from_saved(cls, header, arrays, seed=None):
+        agent = cls(header["epsilon"], header["alpha"], header["gamma"], seed, header["bin_size"], header["hidden"],
+                    batch_size=header["batch_size"], learn_every=header["learn_every"], target_every=header["target_every"])
+        for name in agent.params:
+            agent.params[name][:] = arrays[name]
+            agent.target[name][:] = arrays[name]
+
+        return agent
+
+
+AGENTS = {"tiles": TileCodingAgent, "mlp": MLPAgent}
+
+
+def load_agent(path, seed=None):
+    with np.load(path) as arrays:
+        header = json.loads(str(arrays["header"]))
+        agent = AGENTS[header["kind"]].from_saved(header, arrays, seed)
+
+    agent.epsilon_decay = header["epsilon_decay"]
+    agent.min_epsilon = header["min_epsilon"]
+    return agent
+
+
+def approx_path(path, kind):
+    # where an agent of this kind goes instead of a .qtab at `path`
+    return f"{path.rsplit('.', 1)[0]}.{kind}.npz"
@@ -0,0 +1,351 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+import ai
+import fast_physics
+import model_io
+from ai import Q_learning, ACTIONS, GAME_SPEED, create_state
+from frame_skip import FrameSkip
+from mapped_policy import MappedPolicy
+from physics import Game, Paddle, FRAME_DT, LEFT_PADDLE_X, RIGHT_PADDLE_X, PADDLE_START_Y
+from state import PairEncoder, pack_state
+from vec_env import VecGame
+
+# Benchmarks for the training and inference hot paths.
+#
+#   python bench.py                      run everything, print JSON
+#   python bench.py --output out.json    also write it to a file
+#   python bench.py --save-baseline      store the results as the baseline
+#   python bench.py --compare            fail if anything regressed
+#
+# Every benchmark seeds `random` and NumPy first and reports the best of a
+# few repeats, which is what is least sensitive to a noisy machine.
+
+BASELINE_PATH = "bench_baseline.json"
+MODEL = os.path.join("models", "LEFT_BEST_MODEL_YET")
+
+BENCHMARKS = {}
+
+
+def benchmark(name, unit, higher_is_better=True):
+    def register(fn):
+        BENCHMARKS[name] = (fn, unit, higher_is_better)
+        return fn
+
+    return register
+
+
+def seed(n=0):
+    random.seed(n)
+    np.random.seed(n)
+
+
+def best_of(repeats, fn):
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def make_players():
+    game = Game(GAME_SPEED, FRAME_DT)
+    p1 = Paddle(GAME_SPEED * game.dt, 1, LEFT_PADDLE_X, PADDLE_START_Y)
+    p2 = Paddle(GAME_SPEED * game.dt, 2, RIGHT_PADDLE_X, PADDLE_START_Y)
+    return game, p1, p2
+
+
+def model_states(agent):
+    return sorted({state for (state, action), value in agent.q.entries()})
+
+
+@benchmark("physics_steps", "steps/s")
+def bench_physics(scale):
+    seed()
+    game, p1, p2 = make_players()
+    ball = game.ball
+    n = 200000 // scale
+
+    def run():
+        for i in range(n):
+            ball.update(p1.rect, p2.rect)
+            ball.check_collisions(p1.rect, p2.rect)
+            game.update_points()
+
+    return n / best_of(3, run)
+
+
+@benchmark("advance_frames", "frames/s")
+def bench_advance(scale):
+    seed()
+    game, p1, p2 = make_players()
+    ball = game.ball
+    n = 1000000 // scale
+
+    def run():
+        done = 0
+        while done < n:
+            frames, hit = fast_physics.advance(ball, p1.rect, p2.rect, n - done)
+            done += frames
+            game.update_points()
+
+    return n / best_of(3, run)
+
+
+@benchmark("frame_skip_frames", "frames/s")
+def bench_frame_skip(scale):
+    # decisions every 16 frames with random actions
+    seed()
+    game = Game(GAME_SPEED, FRAME_DT)
+    env = FrameSkip(game, skip=16)
+    actions = [random.randrange(len(ACTIONS)) for i in range(2000 // scale)]
+
+    frames = []
+
+    def run():
+        # the same games every repeat
+        game.reset(0)
+        total = 0
+        for action in actions:
+            env.step(action, action)
+            if game.win():
+                total += game.frames
+                game.reset()
+
+        frames.append(total + game.frames)
+
+    seconds = best_of(3, run)
+    return frames[0] / seconds
+
+
+@benchmark("create_state", "states/s")
+def bench_create_state(scale):
+    seed()
+    game, p1, p2 = make_players()
+    ball = game.ball
+    n = 200000 // scale
+
+    def run():
+        for i in range(n):
+            create_state(p1, p2, ball)
+
+    return n / best_of(3, run)
+
+
+@benchmark("state_keys", "states/s")
+def bench_state_keys(scale):
+    # both paddles' packed keys per call, as play_episode encodes them
+    seed()
+    game, p1, p2 = make_players()
+    ball = game.ball
+    encoder = PairEncoder()
+    n = 200000 // scale
+
+    def run():
+        for i in range(n):
+            encoder.keys(p1, p2, ball)
+
+    return 2 * n / best_of(3, run)
+
+
+def agent_latency(backend, method, scale, packed=False):
+    # packed: states as pack_state() keys, the way the training loops pass them
+    seed()
+    agent = Q_learning.load(MODEL + ".qtab", backend)
+    agent.epsilon = 0
+    states = model_states(agent)
+    if packed:
+        states = [pack_state(state) for state in states]
+
+    n = 100000 // scale
+
+    pairs = [(random.choice(states), random.choice(states), random.randrange(len(ACTIONS))) for i in range(n)]
+
+    if method == "choose_action":
+        def run():
+            for state, new_state, action in pairs:
+                agent.choose_action(state)
+
+    else:
+        def run():
+            for state, new_state, action in pairs:
+                agent.update(state, new_state, 0.2, action)
+
+    return best_of(3, run) / n * 1e6
+
+
+@benchmark("choose_action_dict", "us/call", higher_is_better=False)
+def bench_choose_dict(scale):
+    return agent_latency("dict", "choose_action", scale)
+
+
+@benchmark("choose_action_dense", "us/call", higher_is_better=False)
+def bench_choose_dense(scale):
+    return agent_latency("dense", "choose_action", scale)
+
+
+@benchmark("update_dict", "us/call", higher_is_better=False)
+def bench_update_dict(scale):
+    return agent_latency("dict", "update", scale)
+
+
+@benchmark("update_dense", "us/call", higher_is_better=False)
+def bench_update_dense(scale):
+    return agent_latency("dense", "update", scale)
+
+
+@benchmark("choose_action_packed", "us/call", higher_is_better=False)
+def bench_choose_packed(scale):
+    return agent_latency("dict", "choose_action", scale, packed=True)
+
+
+@benchmark("update_packed", "us/call", higher_is_better=False)
+def bench_update_packed(scale):
+    return agent_latency("dict", "update", scale, packed=True)
+
+
+def batch_latency(backend, scale):
+    # choose_actions over the states of a batch of environments mid-game
+    seed()
+    agent = Q_learning.load(MODEL + ".qtab", backend)
+    agent.epsilon = 0
+    env = VecGame(4096, GAME_SPEED, seed=0)
+    for i in range(100):
+        env.step(*(np.random.randint(0, 2, env.n) for p in range(2)))
+
+    states = env.states()[0]
+    repeats = max(1, 20 // scale)
+
+    def run():
+        for i in range(repeats):
+            agent.choose_actions(states)
+
+    return best_of(3, run) / (repeats * len(states)) * 1e6
+
+
+@benchmark("choose_actions_dict", "us/state", higher_is_better=False)
+def bench_choose_actions_dict(scale):
+    return batch_latency("dict", scale)
+
+
+@benchmark("choose_actions_dense", "us/state", higher_is_better=False)
+def bench_choose_actions_dense(scale):
+    return batch_latency("dense", scale)
+
+
+@benchmark("train_episodes", "episodes/s")
+def bench_train(scale):
+    n = max(1, 4 // scale)
+
+    def run():
+        seed()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ai.train(n, left_q=Q_learning(GAME_SPEED), right_q=Q_learning(GAME_SPEED))
+
+    return n / best_of(2, run)
+
+
+@benchmark("load_pickle", "ms", higher_is_better=False)
+def bench_load_pickle(scale):
+    return best_of(5, lambda: model_io.load_pickle(MODEL + ".pkl")) * 1000
+
+
+@benchmark("load_qtab_dict", "ms", higher_is_better=False)
+def bench_load_qtab(scale):
+    return best_of(5, lambda: Q_learning.load(MODEL + ".qtab")) * 1000
+
+
+@benchmark("load_qtab_dense", "ms", higher_is_better=False)
+def bench_load_qtab_dense(scale):
+    return best_of(5, lambda: Q_learning.load(MODEL + ".qtab", "dense")) * 1000
+
+
+@benchmark("load_mapped", "ms", higher_is_better=False)
+def bench_load_mapped(scale):
+    return best_of(5, lambda: MappedPolicy(MODEL + ".qtab").close()) * 1000
+
+
+def run_benchmarks(names, scale=1):
+    results = {}
+    for name in names:
+        fn, unit, higher_is_better = BENCHMARKS[name]
+        value = fn(scale)
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name:24} {value:14.3f} {unit}", file=sys.stderr)
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": scale,
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    # -> names of benchmarks more than `tolerance` worse than the baseline
+    regressions = []
+
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+
+        old = baseline["results"][name]["value"]
+        new = result["value"]
+        change = (new - old) / old if old else 0
+        if not result["higher_is_better"]:
+            change = -change
+
+        status = "ok"
+        if change < -tolerance:
+            status = "REGRESSION"
+            regressions.append(name)
+
+        print(f"{name:24} {old:14.3f} -> {new:14.3f} {result['unit']:12} {change:+8.1%}  {status}", file=sys.stderr)
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the training and inference hot paths")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--quick", action="store_true", help="run a tenth of the iterations")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="exit non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing (default 25%%)")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    report = run_benchmarks(args.names or list(BENCHMARKS), 10 if args.quick else 1)
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
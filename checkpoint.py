@@ -0,0 +1,167 @@
+import json
+import os
+import random
+import time
+
+import model_io
+from ai import Q_learning
+
+# Training checkpoints in one directory:
+#
+#   manifest.json                   what to load, replaced atomically last
+#   00000040-left-full.qtab         full snapshot of each agent
+#   00000050-left-delta.qtab        entries written since the checkpoint before
+#   ...
+#
+# A checkpoint is a full snapshot every `compact_every` checkpoints and a
+# delta otherwise. Resuming loads the snapshot and replays the deltas in
+# order. Values are stored as float64 so a resumed run continues bit for bit.
+# Every file goes through a temporary file and os.replace(), so a crash at any
+# point leaves the previous manifest and everything it names intact.
+
+MANIFEST = "manifest.json"
+
+
+def get_rng_state(rng):
+    # None for the global random module, which is saved once for everyone
+    return None if rng is random else rng.getstate()
+
+
+def set_rng_state(state):
+    if state is None:
+        return random
+
+    version, internal, gauss = state
+    rng = random.Random()
+    rng.setstate((version, tuple(internal), gauss))
+    return rng
+
+
+def atomic_write(path, write):
+    tmp = path + ".tmp"
+    write(tmp)
+
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+
+
+class Checkpointer():
+    def __init__(self, directory, every_episodes=None, every_seconds=None, compact_every=10):
+        self.directory = directory
+        self.every_episodes = every_episodes
+        self.every_seconds = every_seconds
+        self.compact_every = compact_every
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.manifest = None
+        self.last_episode = 0
+        self.last_time = time.monotonic()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def due(self, episode):
+        if self.every_episodes and episode - self.last_episode >= self.every_episodes:
+            return True
+
+        if self.every_seconds and time.monotonic() - self.last_time >= self.every_seconds:
+            return True
+
+        return False
+
+    def maybe_save(self, episode, left_q, right_q):
+        if self.due(episode):
+            self.save(episode, left_q, right_q)
+
+    def save(self, episode, left_q, right_q):
+        if self.manifest and self.manifest["episode"] == episode:
+            return
+
+        # a delta can't record entries a bounded table evicted (replaying it
+        # would bring them back), so an eviction means a full snapshot
+        evicted = any(getattr(agent.q, "evictions", 0) for agent in (left_q, right_q))
+        full = self.manifest is None or evicted or len(self.manifest["deltas"]) + 1 >= self.compact_every
+        kind = "full" if full else "delta"
+
+        files = {}
+        for side, agent in (("left", left_q), ("right", right_q)):
+            name = f"{episode:08d}-{side}-{kind}.qtab"
+            # taken either way: a full snapshot covers everything that was dirty
+            items = agent.q.take_dirty()
+            atomic_write(self.path(name), lambda tmp: agent.save(tmp, None if full else items, "<f8"))
+            files[side] = name
+
+        old_files = []
+        if full:
+            if self.manifest:
+                old_files = self.manifest_files(self.manifest)
+
+            manifest = {"snapshot": files, "deltas": []}
+
+        else:
+            manifest = dict(self.manifest)
+            manifest["deltas"] = manifest["deltas"] + [files]
+
+        manifest.update({
+            "episode": episode,
+            "left_epsilon": left_q.epsilon,
+            "right_epsilon": right_q.epsilon,
+            "left_rng_state": get_rng_state(left_q.rng),
+            "right_rng_state": get_rng_state(right_q.rng),
+            "random_state": random.getstate(),
+        })
+        atomic_write(self.path(MANIFEST), lambda tmp: self.write_manifest(tmp, manifest))
+
+        self.manifest = manifest
+        self.last_episode = episode
+        self.last_time = time.monotonic()
+
+        # only once the new manifest is in place
+        for name in set(old_files) - set(manifest["snapshot"].values()):
+            if os.path.exists(self.path(name)):
+                os.remove(self.path(name))
+
+    def write_manifest(self, path, manifest):
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    def manifest_files(self, manifest):
+        names = list(manifest["snapshot"].values())
+        for delta in manifest["deltas"]:
+            names += delta.values()
+
+        return names
+
+    def exists(self):
+        return os.path.exists(self.path(MANIFEST))
+
+    def resume(self, backend="dict", max_states=None):
+        # -> (episode, left_q, right_q) exactly as they were at the last checkpoint,
+        # on the backend (and table bound) the run was using
+        with open(self.path(MANIFEST)) as f:
+            manifest = json.load(f)
+
+        agents = []
+        for side in ("left", "right"):
+            agent = Q_learning.load(self.path(manifest["snapshot"][side]), backend, max_states=max_states)
+
+            for delta in manifest["deltas"]:
+                header, arrays = model_io.read_sections(self.path(delta[side]))
+                model_io.load_rows(agent.q, header, arrays)
+
+            agent.epsilon = manifest[f"{side}_epsilon"]
+            agent.rng = set_rng_state(manifest.get(f"{side}_rng_state"))
+            agent.q.take_dirty()
+            agents.append(agent)
+
+        version, internal, gauss = manifest["random_state"]
+        random.setstate((version, tuple(internal), gauss))
+
+        self.manifest = manifest
+        self.last_episode = manifest["episode"]
+        self.last_time = time.monotonic()
+
+        return manifest["episode"], agents[0], agents[1]
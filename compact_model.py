@@ -0,0 +1,42 @@
+import argparse
+import os
+
+from ai import Q_learning
+
+# Shrinks a .qtab model: drops the entries pruning says aren't worth keeping
+# and stores the values in fewer bytes.
+#
+#   python compact_model.py models/RIGHT_BEST_MODEL_YET.qtab small.qtab --min-visits 3 --dtype i1
+#
+# --min-visits only has something to go on for models saved with visit
+# counts; older files are pruned of default-valued entries only.
+
+DTYPES = {"f4": "<f4", "f2": "<f2", "i1": "i1"}
+
+
+def compact(path, out, min_visits=None, merge=False, dtype="f4"):
+    agent = Q_learning.load(path)
+    entries = len(agent.q)
+
+    if min_visits and not agent.q.visits:
+        print(f"{path}: no visit counts saved, --min-visits has nothing to prune by")
+        min_visits = None
+
+    dropped = agent.prune(min_visits, merge)
+    agent.save(out, value_dtype=DTYPES[dtype])
+
+    print(f"{path}: {entries} -> {len(agent.q)} entries ({dropped} dropped), "
+          f"{os.path.getsize(path) / 1024:.0f} KiB -> {os.path.getsize(out) / 1024:.0f} KiB"
+          + (f", default {agent.q.default:.4f}" if agent.q.default else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune and quantize a .qtab model")
+    parser.add_argument("model")
+    parser.add_argument("out")
+    parser.add_argument("--min-visits", type=int, help="drop entries updated fewer times than this")
+    parser.add_argument("--merge", action="store_true", help="fold the dropped entries' mean into the default value")
+    parser.add_argument("--dtype", choices=DTYPES, default="f4", help="how the values are stored (i1: int8, scaled)")
+    args = parser.parse_args()
+
+    compact(args.model, args.out, args.min_visits, args.merge, args.dtype)
@@ -0,0 +1,149 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import statistics
+import time
+from collections import deque
+
+from ai import Q_learning, GAME_SPEED, derive_seed, play_episode
+from multistep import NStepLearner, WatkinsLearner
+from physics import make_rng
+from sweep import REFERENCE_PATH
+from tournament import load_policy
+
+# How many games each update rule needs to learn to beat a fixed opponent.
+#
+#   python convergence.py                               q, nstep:4, lambda:0.8
+#   python convergence.py q nstep:8 lambda:0.9 --seeds 10 --target 0.6
+#
+# A fresh left agent trains with play_episode against the reference model,
+# which plays greedily and doesn't learn. A rule has converged once the
+# agent has won `target` of the last `window` games. Each rule is run on
+# the same `seeds` seeds (serves and exploration); the table has the games
+# and training seconds that took, with runs that never got there within
+# `max_games` counted as max_games in the median.
+
+
+class FrozenPolicy():
+    # the reference as an opponent: plays, never learns
+    def __init__(self, agent):
+        self.agent = agent
+
+    def choose_action(self, state):
+        return self.agent.choose_action(state)
+
+    def update(self, old_state, new_state, reward, action):
+        pass
+
+
+def make_learner(mode, agent):
+    # "q", "nstep:N" or "lambda:L"
+    name, _, value = mode.partition(":")
+    if name == "q":
+        return agent
+    elif name == "nstep":
+        return NStepLearner(agent, int(value or 4))
+    elif name == "lambda":
+        return WatkinsLearner(agent, float(value or 0.8))
+
+    raise ValueError(f"unknown update rule: {mode!r} (q, nstep:N or lambda:L)")
+
+
+_reference = None
+
+
+def init_worker(reference_path):
+    global _reference
+    _reference = FrozenPolicy(load_policy(reference_path))
+
+
+def run(job):
+    # job: (mode, seed, settings) -> (mode, seed, result)
+    mode, seed, settings = job
+    # the reference's tie-breaks too, so a run doesn't depend on what its
+    # worker ran before
+    _reference.agent.rng = make_rng(derive_seed(seed, "right"))
+    agent = Q_learning(GAME_SPEED, seed=derive_seed(seed, "left"))
+    learner = make_learner(mode, agent)
+
+    recent = deque(maxlen=settings["window"])
+    seconds = 0
+    game = None
+
+    for i in range(settings["max_games"]):
+        start = time.perf_counter()
+        game = play_episode(learner, _reference, seed=derive_seed(seed, i), game=game)
+        if learner is not agent:
+            learner.end_episode()
+        agent.decay_epslion()
+        seconds += time.perf_counter() - start
+
+        recent.append(game.win() == 1)
+        if len(recent) == recent.maxlen and sum(recent) / len(recent) >= settings["target"]:
+            return mode, seed, {"games": i + 1, "seconds": seconds, "reached": True, "q_size": len(agent.q)}
+
+    return mode, seed, {"games": settings["max_games"], "seconds": seconds, "reached": False, "q_size": len(agent.q)}
+
+
+def run_convergence(modes, reference_path=REFERENCE_PATH, seeds=5, target=0.5, window=10, max_games=300, workers=None):
+    for mode in modes:
+        make_learner(mode, None)
+
+    settings = {"target": target, "window": window, "max_games": max_games}
+    jobs = [(mode, seed, settings) for mode in modes for seed in range(seeds)]
+    results = {mode: [None] * seeds for mode in modes}
+
+    with mp.Pool(workers or os.cpu_count(), init_worker, (reference_path,)) as pool:
+        for mode, seed, result in pool.imap_unordered(run, jobs):
+            results[mode][seed] = result
+
+    return results
+
+
+def summarize(results):
+    rows = []
+    for mode, runs in results.items():
+        rows.append({
+            "mode": mode,
+            "median_games": statistics.median(r["games"] for r in runs),
+            "mean_seconds": statistics.mean(r["seconds"] for r in runs),
+            "reached": sum(r["reached"] for r in runs),
+            "runs": len(runs),
+            "games": [r["games"] for r in runs],
+        })
+
+    return rows
+
+
+def print_summary(rows, target, window):
+    print(f"games to a {target:.0%} win rate over {window} games")
+    print(f"{'rule':<12}  {'median':>6}  {'reached':>7}  {'train s':>8}  games per seed")
+    for row in rows:
+        reached = f"{row['reached']}/{row['runs']}"
+        print(f"{row['mode']:<12}  {row['median_games']:6.1f}  {reached:>7}  {row['mean_seconds']:8.1f}  {row['games']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Games to converge, per Q-learning update rule")
+    parser.add_argument("modes", nargs="*", default=["q", "nstep:4", "lambda:0.8"], help="q, nstep:N or lambda:L")
+    parser.add_argument("--reference", default=REFERENCE_PATH, help="the opponent, a right paddle model")
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--target", type=float, default=0.5, help="win rate to reach")
+    parser.add_argument("--window", type=int, default=10, help="games the win rate is over")
+    parser.add_argument("--max-games", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+
+    try:
+        results = run_convergence(args.modes, args.reference, args.seeds, args.target, args.window, args.max_games, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rows = summarize(results)
+    print_summary(rows, args.target, args.window)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": rows, "runs": results}, f, indent=2)
@@ -0,0 +1,39 @@
+import glob
+import os
+import sys
+import time
+
+from ai import Q_learning
+import model_io
+
+# Rewrites every pickled model in models/ (or the paths given) as a .qtab
+# file next to it, checks it loads back to the same table, and reports sizes
+# and load times for both.
+
+
+def convert(path):
+    start = time.perf_counter()
+    agent = model_io.load_pickle(path)
+    pickle_time = time.perf_counter() - start
+
+    out = os.path.splitext(path)[0] + ".qtab"
+    agent.save(out)
+
+    start = time.perf_counter()
+    loaded = Q_learning.load(out)
+    qtab_time = time.perf_counter() - start
+
+    for key, value in agent.q.items():
+        if abs(loaded.q.get_entry(key) - value) > 1e-5 * max(1, abs(value)):
+            raise ValueError(f"{out}: {key} came back as {loaded.q.get_entry(key)}, expected {value}")
+
+    print(f"{path}: {len(agent.q)} entries, "
+          f"{os.path.getsize(path) / 1024:.0f} KiB -> {os.path.getsize(out) / 1024:.0f} KiB, "
+          f"load {pickle_time * 1000:.1f} ms -> {qtab_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join("models", "*.pkl")))
+
+    for path in paths:
+        convert(path)
@@ -0,0 +1,202 @@
+import math
+
+from physics import WIDTH, HEIGHT, PADDLE_WIDTH, PADDLE_HEIGHT
+
+# Event-driven stepping for physics.Ball.
+#
+# Between collisions the ball moves in a straight line, so instead of running
+# the whole of Ball.update() every frame we work out in closed form how many
+# frames are left until the next thing check_collisions() or did_hit_sides()
+# would react to (a wall, a paddle or a goal line) and skip the collision
+# checks for the quiet frames. The last couple of frames before an event still
+# go through Ball.update(), so every bounce is decided by the same code.
+#
+# The skipped frames still add Vx/Vy one frame at a time rather than jumping
+# with x + k*Vx: at the default speed the ball moves a third of a pixel a
+# frame and lands exactly on the walls and bin edges, so which side of them it
+# ends up on comes down to the rounding of the repeated additions, and
+# trajectories only stay identical to the stepped game if that is kept.
+#
+# Paddle contact is swept: if the ball moves far enough in one frame to pass
+# through a paddle without any frame landing inside it (high GAME_SPEED), the
+# ball is stopped at the point of contact and bounced there instead.
+
+INF = float("inf")
+
+
+def slab(p, v, lo, hi):
+    # times when p + v*t is inside [lo, hi]
+    if v == 0:
+        return (-INF, INF) if lo <= p <= hi else None
+
+    t0 = (lo - p) / v
+    t1 = (hi - p) / v
+    return (t0, t1) if t0 <= t1 else (t1, t0)
+
+
+def box_interval(x, y, vx, vy, x0, x1, y0, y1):
+    tx = slab(x, vx, x0, x1)
+    ty = slab(y, vy, y0, y1)
+    if tx is None or ty is None:
+        return None
+
+    t0 = max(tx[0], ty[0])
+    t1 = min(tx[1], ty[1])
+    return (t0, t1) if t0 <= t1 else None
+
+
+def circle_interval(x, y, vx, vy, cx, cy, r):
+    dx = x - cx
+    dy = y - cy
+    a = vx * vx + vy * vy
+    b = 2 * (dx * vx + dy * vy)
+    c = dx * dx + dy * dy - r * r
+
+    if a == 0:
+        return (-INF, INF) if c <= 0 else None
+
+    disc = b * b - 4 * a * c
+    if disc < 0:
+        return None
+
+    root = math.sqrt(disc)
+    return ((-b - root) / (2 * a), (-b + root) / (2 * a))
+
+
+def contact_interval(x, y, vx, vy, rect, r):
+    # times when the ball is within r of the paddle: the line against the
+    # paddle rectangle rounded by r, which is convex, so one interval
+    x0, y0 = rect.x, rect.y
+    x1, y1 = rect.x + PADDLE_WIDTH, rect.y + PADDLE_HEIGHT
+
+    pieces = [
+        box_interval(x, y, vx, vy, x0 - r, x1 + r, y0, y1),
+        box_interval(x, y, vx, vy, x0, x1, y0 - r, y1 + r),
+        circle_interval(x, y, vx, vy, x0, y0, r),
+        circle_interval(x, y, vx, vy, x1, y0, r),
+        circle_interval(x, y, vx, vy, x0, y1, r),
+        circle_interval(x, y, vx, vy, x1, y1, r),
+    ]
+    pieces = [p for p in pieces if p is not None]
+    if not pieces:
+        return None
+
+    return (min(p[0] for p in pieces), max(p[1] for p in pieces))
+
+
+def frames_until(p, v, limit, below):
+    # first frame k >= 1 where p + k*v has crossed `limit` (<= when below)
+    if below:
+        if p <= limit: return 1
+        if v >= 0: return INF
+        return math.ceil((p - limit) / -v)
+
+    if p >= limit: return 1
+    if v <= 0: return INF
+    return math.ceil((limit - p) / v)
+
+
+def next_event(ball, rect1, rect2):
+    # -> (frames until the next wall/paddle/goal event, swept paddle contact)
+    #
+    # swept is (player, t) when a paddle would be passed through between two
+    # frames without a frame ever touching it, t being the time of contact
+    x, y, vx, vy = ball.x, ball.y, ball.Vx, ball.Vy
+    goal = ball.radis * 2
+
+    frames = min(
+        frames_until(y, vy, 0, True),
+        frames_until(y, vy, HEIGHT, False),
+        frames_until(x, vx, -goal, True),
+        frames_until(x, vx, WIDTH + goal, False),
+    )
+    swept = None
+
+    for player, rect in ((1, rect1), (2, rect2)):
+        interval = contact_interval(x, y, vx, vy, rect, ball.radis)
+        if interval is None or interval[1] < 0:
+            continue
+
+        t0, t1 = interval
+        k = math.ceil(t0)
+
+        if t0 > 0 and k > t1:
+            # no frame lands inside the paddle
+            if k <= frames:
+                frames = k
+                swept = (player, t0)
+
+        elif t0 <= 1:
+            # touching now or on the very next frame: step it normally
+            return 1, None
+
+        else:
+            frames = min(frames, k)
+
+    if swept and math.ceil(swept[1]) != frames:
+        swept = None
+
+    return frames, swept
+
+
+def swept_bounce(ball, rect1, rect2, player, t):
+    # the frame in which the ball would tunnel through `player`'s paddle:
+    # stop at the point of contact and bounce the way check_collisions would
+    rect = rect1 if player == 1 else rect2
+
+    ball.x += ball.Vx * t
+    ball.y += ball.Vy * t
+
+    if ball.y <= 0 or ball.y >= HEIGHT:
+        ball.Vy *= -1
+
+    if ball.y <= rect.y or ball.y >= rect.y + PADDLE_HEIGHT:
+        ball.Vy *= -1
+
+    else:
+        ball.Vx *= -1
+
+    return player
+
+
+def advance(ball, rect1, rect2, frames):
+    # Ball.update() `frames` times, stopping early once the ball is past a
+    # goal line so the caller can score it.
+    # -> (frames advanced, first paddle hit or None)
+    done = 0
+    paddle_hit = None
+
+    while done < frames:
+        if ball.is_start:
+            hit = ball.update(rect1, rect2)
+
+        else:
+            k, swept = next_event(ball, rect1, rect2)
+
+            if k > 2:
+                # nothing can happen before frame k: skip to two frames short
+                # of it and let Ball.update() do the rest
+                jump = min(k - 2, frames - done)
+                x, y, vx, vy = ball.x, ball.y, ball.Vx, ball.Vy
+                for i in range(jump):
+                    x += vx
+                    y += vy
+
+                ball.x, ball.y = x, y
+                done += jump
+                continue
+
+            if swept and k == 1:
+                hit = swept_bounce(ball, rect1, rect2, *swept)
+
+            else:
+                hit = ball.update(rect1, rect2)
+
+        done += 1
+        if hit and not paddle_hit:
+            paddle_hit = hit
+
+        if ball.did_hit_sides():
+            break
+
+    return done, paddle_hit
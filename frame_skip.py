@@ -0,0 +1,123 @@
+import math
+
+from fast_physics import advance
+from physics import PADDLE_WIDTH
+from state import PairEncoder, pack_state
+
+# Decisions every few frames, the same way in training and in the game.
+#
+# A decision holds each paddle's action for `skip` frames. Every frame, in
+# this order (the same as VecGame and game.Game.update_all):
+#
+#   paddles move `paddle_steps` steps, their rects catch up, the ball moves
+#   one frame and collides, a goal is scored
+#
+# A goal ends the decision early. The state handed back is the last frame's,
+# or with pool="max" the elementwise max of the last two frames' states, and
+# is taken before a goal puts the ball back in the middle (like train()).
+# States are create_state tuples, or pack_state() keys with packed=True,
+# from `encoder` (a state.PairEncoder, default bins if not given).
+
+DECISION_INTERVAL = 1
+PADDLE_STEPS = 10
+POOLS = ("last", "max")
+
+
+class FrameSkip():
+    # fast: while the ball can't reach either paddle within the frames left,
+    # when exactly the paddles move makes no difference to it, so the
+    # paddles make all those moves at once and the ball jumps ahead with
+    # fast_physics.advance(); the result is the same as stepping each frame
+    def __init__(self, game, skip=DECISION_INTERVAL, paddle_steps=PADDLE_STEPS, pool="last", fast=True, packed=False, encoder=None):
+        if pool not in POOLS:
+            raise ValueError(f"unknown pool: {pool!r}")
+
+        self.game = game
+        self.encoder = encoder or PairEncoder()
+        self.packed = packed
+        self.skip = skip
+        self.paddle_steps = paddle_steps
+        self.pool = pool
+        self.fast = fast
+
+    def observe(self):
+        game = self.game
+        if self.packed:
+            return self.encoder.keys(game.p1, game.p2, game.ball)
+
+        return self.encoder.states(game.p1, game.p2, game.ball)
+
+    def observe_states(self):
+        game = self.game
+        return self.encoder.states(game.p1, game.p2, game.ball)
+
+    def quiet_frames(self):
+        # frames the ball is certain to stay out of reach of both paddles
+        ball = self.game.ball
+        if ball.is_start or ball.Vx == 0:
+            return 0
+
+        # x distances to the near edges of where each paddle can touch it
+        left_gap = ball.x - (self.game.p1.rect.x + PADDLE_WIDTH + ball.radis)
+        right_gap = (self.game.p2.rect.x - ball.radis) - ball.x
+
+        # the paddle it is leaving can still move into it until it is clear
+        if left_gap <= 0 or right_gap <= 0:
+            return 0
+
+        gap = left_gap if ball.Vx < 0 else right_gap
+
+        # a frame short, so float rounding never lets a contact slip by
+        return max(0, math.floor(gap / abs(ball.Vx)) - 1)
+
+    def run(self, action1, action2, frames):
+        # -> (frames run, first paddle hit, goal side)
+        game = self.game
+        ball = game.ball
+
+        quiet = min(frames, self.quiet_frames()) if self.fast else 0
+        n = quiet if quiet > 1 else 1
+
+        game.p1.move(action1, self.paddle_steps * n)
+        game.p2.move(action2, self.paddle_steps * n)
+        game.p1.update()
+        game.p2.update()
+
+        done, hit = advance(ball, game.p1.rect, game.p2.rect, n)
+        game.frames += done
+
+        return done, hit, ball.did_hit_sides()
+
+    def step(self, action1, action2):
+        # -> (state1, state2, first paddle hit, goal side or None)
+        first_hit = None
+        pooled = None
+        left = self.skip
+
+        while left:
+            if self.pool == "max" and left == 1 and self.skip > 1:
+                pooled = self.observe_states()
+
+            # with pooling the last frame is run on its own
+            frames = left - 1 if self.pool == "max" and left > 1 else left
+            done, hit, side = self.run(action1, action2, frames)
+
+            first_hit = first_hit or hit
+            left -= done
+            if side:
+                break
+
+        if pooled and not side:
+            state1, state2 = self.observe_states()
+            state1 = tuple(map(max, state1, pooled[0]))
+            state2 = tuple(map(max, state2, pooled[1]))
+            if self.packed:
+                state1, state2 = pack_state(state1), pack_state(state2)
+
+        else:
+            state1, state2 = self.observe()
+
+        if side:
+            self.game.update_points()
+
+        return state1, state2, first_hit, side
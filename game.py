@@ -2,48 +2,47 @@ import pygame
 import math
 import random
 import time
-import pickle
 
-pygame.init()
+import physics
+from frame_skip import DECISION_INTERVAL, PADDLE_STEPS
+from physics import WIDTH, HEIGHT, PADDLE_WIDTH, PADDLE_HEIGHT, LEFT_PADDLE_X, RIGHT_PADDLE_X, PADDLE_START_Y, FRAME_DT, clamp
+from state import PairEncoder, BIN_SIZE
+from ai import LEFT_MODEL_PATH
+from tournament import load_policy
 
 background_color = (0, 0, 0)
-WIDTH, HEIGHT = 1000, 800
-PADDLE_WIDTH = 30
-PADDLE_HEIGHT = 130
 PADDLE_SPEED = 0.2
-REPEAT_ACTION = 10
 
+# main() steps the simulation SIM_RATE times a second of wall time, however
+# often it draws; drawing is capped at TARGET_FPS
+SIM_RATE = 1000
+TARGET_FPS = 60
+# at most this much wall time is caught up after a stall
+MAX_FRAME_TIME = 0.25
 
-def discretize(val, bin_size):
-    return round(val / bin_size)
+# pygame itself is only initialised once something is drawn (main()), and
+# the score font is loaded once and shared by every Game
+FONT_SIZE = 80
+_font = None
 
 
-def create_state(p, opp, ball):
-    sign = lambda val: 1 if val > 0 else -1
-    return (
-        discretize(p.y, 10),
-        discretize(p.y - ball.y, 10),
-        discretize(ball.x, 10),
-        discretize(ball.y, 10),
-        sign(ball.Vx),
-        sign(ball.Vy),
-    )
+def get_font():
+    global _font
+    if _font is None:
+        pygame.font.init()
+        _font = pygame.font.Font(pygame.font.get_default_font(), FONT_SIZE)
 
-def clamp(a, b, c):
-    if a < b:   return b
-    elif a > c: return c
-    else:       return a
+    return _font
 
 
-class Player():
+class Player(physics.Paddle):
     def __init__(self, speed, screen, player, x, y):
-        self.speed = speed
+        super().__init__(speed, player, x, y)
         self.color = (255, 255, 255)
-        self.x = x
-        self.y = y
         self.screen = screen
-        self.rect = pygame.Rect(self.x, self.y, PADDLE_WIDTH, PADDLE_HEIGHT)
-        self.player = player
+
+    def make_rect(self):
+        return pygame.Rect(self.x, self.y, PADDLE_WIDTH, PADDLE_HEIGHT)
         
     def handle_key_press(self):
         key = pygame.key.get_pressed()
@@ -66,236 +65,202 @@ class Player():
 
     def update(self, draw=True):
         self.handle_key_press()
-        # self.rect = pygame.Rect(self.x, self.y, PADDLE_WIDTH, PADDLE_HEIGHT)    
-        self.rect.update(self.x, self.y, PADDLE_WIDTH, PADDLE_HEIGHT)    
-        
+        super().update()
         
         if draw:
             self.draw()
     
     def draw(self):
-        # pygame.draw.circle(screen, self.color, (self.x, self.y), 10, 10)
-        pygame.draw.rect(self.screen, self.color, self.rect)
-    
-    def check_borders(self):
-        if self.y >= HEIGHT - PADDLE_HEIGHT:
-            self.y = HEIGHT - PADDLE_HEIGHT
-            
-        elif self.y <= 0:
-            self.y = 0
+        return pygame.draw.rect(self.screen, self.color, self.rect)
 
 
 class AI_player(Player):
-    def move(self, action, repeat_action_n):
-        for i in range(repeat_action_n):
-            if action == "up":
-                self.y -= self.speed
+    # moves come from physics.Paddle.move
+    pass
 
-            elif action == "down":
-                self.y += self.speed
-                
-            elif action == "stay":
-                continue
-            
-            self.check_borders()
 
-
-class Ball():
-    def __init__(self, speed, screen):
-        self.x = WIDTH // 2
-        self.y = HEIGHT // 2
+class Ball(physics.Ball):
+    def __init__(self, speed, screen, rng=random):
+        super().__init__(speed, rng)
         self.width = 10
-        self.radis = 10
-
         self.screen = screen
-        # physics
-        directions = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
-        self.direction = random.choice(directions)
-        
-        # Velocities
-        self.Vx = speed * self.direction[0]
-        self.Vy = speed * self.direction[1]
-        
-        self.is_start = True
-        
-    def move_ball(self):
-        if self.is_start:
-            directions = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
-            self.direction = random.choice(directions)
-            
-            self.Vx *= self.direction[0]
-            self.Vy *= self.direction[1]
-
-
-        self.is_start = False
-        self.x += self.Vx
-        self.y += self.Vy
-
         
     def update(self, rect1, rect2, draw=True):
-        self.move_ball()
-        self.check_collisions(rect1, rect2)
+        paddle_hit = super().update(rect1, rect2)
         
         if draw:            
             self.draw(self.x, self.y)
-        
-    def check_collisions(self, rect1: pygame.Rect, rect2: pygame.Rect):
-        ball_point = (self.x, self.y)
-        
-        is_there_collision_y = self.y <= 0 or self.y >= HEIGHT
-        # is_there_collision_x = self.x <= -(self.radis * 2) or self.x >= WIDTH + self.radis * 2            
 
-        if is_there_collision_y:
-            self.Vy *= -1
-        
-        for rect in [rect1, rect2]:            
-            near_x = clamp(self.x, rect.x, rect.x + PADDLE_WIDTH)
-            near_y = clamp(self.y, rect.y, rect.y + PADDLE_HEIGHT)
-            
-            dist = self.distance(ball_point, (near_x, near_y))
-            
-            if dist <= self.radis:      
-                if self.y <= rect.y or self.y >= rect.y + PADDLE_HEIGHT:
-                    self.Vy *= -1
-                    
-                else:
-                    self.Vx *= -1
-                
-                return 1 if rect == rect1 else 2
-                
-            
-        # is_there_collision_y = self.y <= 0 or self.y >= HEIGHT
-        # # is_there_collision_x = self.x <= -(self.radis * 2) or self.x >= WIDTH + self.radis * 2            
-
-        # if is_there_collision_y:
-        #     self.Vy *= -1
-        
-        # if is_there_collision_x:
-        #     self.Vx *= -1
-    
-    def did_hit_sides(self):
-        left_wall_collision = self.x <= -(self.radis * 2)
-        right_wall_collision = self.x >= WIDTH + self.radis * 2
-        
-        # left wall collision: 1
-        # right wall collision: -1
-        if left_wall_collision: return -1
-        if right_wall_collision: return 1
-        
-        # return False
-    
-    def re_render_ball_after_loss(self, draw=True):
-        self.is_start = True
-                
-        self.x = WIDTH // 2
-        self.y = HEIGHT // 2
-        
-        if draw:
-            self.draw(self.x, self.y)
-    
-    def distance(self, pt1, pt2):
-        return math.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
+        return paddle_hit
         
     def draw(self, x, y, color=(255, 255, 255)):
-        pygame.draw.circle(self.screen, color, (x, y), self.radis, self.width)
+        return pygame.draw.circle(self.screen, color, (x, y), self.radis, self.width)
+
     
-class Game:
-    def __init__(self, speed, screen, ai=None):
-        self.dt = pygame.time.Clock().tick(60) / 1000 
-        
+class Game(physics.Game):
+    def __init__(self, speed, screen, ai=None, dt=FRAME_DT, seed=None, skip=DECISION_INTERVAL, paddle_steps=PADDLE_STEPS, pool="last", left_ai=None):
+        # skip, paddle_steps, pool: how the AI plays, as in frame_skip.FrameSkip
+        # left_ai: plays the left paddle when that's an AI_player
         self.screen = screen
-        
-        self.p1 = Player(speed * self.dt, self.screen, 1, 30, HEIGHT // 2 - 100)
-        self.p2 = Player(speed * self.dt, self.screen, 2, 930, HEIGHT // 2 - 100)
         self.ai = ai
-        if self.ai:
-            self.p2 = AI_player(speed * self.dt, self.screen, 2, 930, HEIGHT // 2 - 100)
-        
-        self.ball = Ball(speed * self.dt, self.screen)
-        
-        self.p1_points = 0
-        self.p2_points = 0
-        self.points_to_win = 5
-        
-        self.frames = 0
-        
-        pygame.font.init()
-        self.font = pygame.font.Font(pygame.font.get_default_font(), 80)
-        
+        self.left_ai = left_ai
+        self.skip = skip
+        self.paddle_steps = paddle_steps
+        self.pool = pool
+
+        # frames left of the AI's current decision, and its actions
+        self.decision_left = 0
+        self.actions = (None, None)
+        self.pooled = None
+        # the same create_state views training uses, each side in its own
+        # AI's bins
+        right_bin_size = getattr(ai, "bin_size", BIN_SIZE)
+        self.encoder = PairEncoder(getattr(left_ai, "bin_size", right_bin_size), right_bin_size)
+
+        super().__init__(speed, dt, seed)
+
+        # points -> rendered score text, per side
+        self.score_surfaces = ({}, {})
+        # what render() drew last time, to be erased next time
+        self.drawn = []
+        self.drawn_points = None
+        self.points_rects = []
+
+    @property
+    def font(self):
+        return get_font()
+
+    def make_player(self, speed, player, x, y):
+        if self.ai and player == 2:
+            return AI_player(speed, self.screen, player, x, y)
+
+        return Player(speed, self.screen, player, x, y)
+
+    def make_ball(self, speed):
+        return Ball(speed, self.screen, self.rng)
+        
+    def score_surface(self, side, points):
+        # font.render is slow; a score only needs rendering once. Opaque, so
+        # drawing it again over itself leaves it as it was
+        cache = self.score_surfaces[side]
+        if points not in cache:
+            cache[points] = self.font.render(str(points), True, (84, 84, 84), background_color)
+
+        return cache[points]
+
     def draw_points(self):
-        text = self.font.render(str(self.p1_points), True, (84, 84, 84))
-        self.screen.blit(text, (WIDTH//2 - 250, HEIGHT//2 - 50))
+        rect1 = self.screen.blit(self.score_surface(0, self.p1_points), (WIDTH//2 - 250, HEIGHT//2 - 50))
+        rect2 = self.screen.blit(self.score_surface(1, self.p2_points), (WIDTH//2 + 250, HEIGHT//2 - 50))
+        return [rect1, rect2]
+
+    def render(self):
+        # Draw the current frame, updating only what changed on screen: the
+        # last frame's ball and paddles are painted over with the
+        # background, and their old and new spots plus the scores (when
+        # they changed or the ball passed over them) are sent to the display.
+        if not self.drawn:
+            self.screen.fill(background_color)
+
+        for rect in self.drawn:
+            self.screen.fill(background_color, rect)
+
+        score_changed = self.drawn_points != (self.p1_points, self.p2_points)
+        if score_changed:
+            for rect in self.points_rects:
+                self.screen.fill(background_color, rect)
+
+        old_points = self.points_rects
+        self.points_rects = self.draw_points()
+        drawn = [self.ball.draw(self.ball.x, self.ball.y), self.p1.draw(), self.p2.draw()]
+
+        dirty = self.drawn + drawn
+        if score_changed:
+            dirty += old_points + self.points_rects
+
+        elif any(rect.collidelist(dirty) != -1 for rect in self.points_rects):
+            dirty += self.points_rects
+
+        if self.drawn:
+            pygame.display.update(dirty)
+        else:
+            pygame.display.flip()
 
-        text = self.font.render(str(self.p2_points), True, (84, 84, 84))
-        self.screen.blit(text, (WIDTH//2 + 250, HEIGHT//2 - 50))
+        self.drawn = drawn
+        self.drawn_points = (self.p1_points, self.p2_points)
     
     def update_points(self, draw=True):
-        wall = self.ball.did_hit_sides()
-        if wall == -1:
-            self.p2_points += 1
-            self.ball.re_render_ball_after_loss(draw)
-            
-        if wall == 1:
-            self.p1_points += 1
-            self.ball.re_render_ball_after_loss(draw)
+        wall = super().update_points()
+        if wall and draw:
+            self.ball.draw(self.ball.x, self.ball.y)
             
         if draw:
             self.draw_points()
+
+        return wall
         
         
+    def ai_states(self):
+        return self.encoder.states(self.p1, self.p2, self.ball)
+
+    def move_ai(self):
+        # a new decision every `skip` frames (and after every goal), held
+        # in between, one frame's worth of moves per call
+        if self.decision_left == 0:
+            state1, state2 = self.ai_states()
+            if self.pooled:
+                state1 = tuple(map(max, state1, self.pooled[0]))
+                state2 = tuple(map(max, state2, self.pooled[1]))
+
+            action1 = self.left_ai.choose_action(state1) if type(self.p1) == AI_player else None
+            action2 = self.ai.choose_action(state2)
+
+            self.actions = (action1, action2)
+            self.decision_left = self.skip
+            self.pooled = None
+
+        action1, action2 = self.actions
+        if action1 is not None:
+            self.p1.move(action1, self.paddle_steps)
+
+        self.p2.move(action2, self.paddle_steps)
+
     def update_all(self, draw=True):
-        self.ball.update(self.p1.rect, self.p2.rect, draw)
-        self.update_points(draw)
+        # one frame, in frame_skip's order: paddles move, then the ball
+        if self.ai:
+            self.move_ai()
 
         self.p1.update(draw)
         self.p2.update(draw)
-        
-        
-        if self.ai:
-            if type(self.p1) == AI_player:
-                action1 = self.left_ai.choose_action(create_state(self.p1, self.p2, self.ball))
-                self.p1.move(action1, 1)
-            
-                # for i in range(10):
-                #     self.p1.move(action1)
-            
-            action2 = self.ai.choose_action(create_state(self.p2, self.p1, self.ball))
-            # print(action2)
-            self.p2.move(action2, REPEAT_ACTION)
-                
-                # for i in range(10):
-                #     self.p2.move(action2)
-                    
+
+        self.ball.update(self.p1.rect, self.p2.rect, draw)
         self.frames += 1
-        
-        
-    def win(self):
-        if self.p1_points == self.points_to_win:
-            return 1
-        
-        elif self.p2_points == self.points_to_win:
-            return 2
 
-        else:
-            return 0
+        if self.ai:
+            self.decision_left -= 1
+            if self.pool == "max" and self.decision_left == 1:
+                self.pooled = self.ai_states()
+
+        if self.update_points(draw):
+            self.decision_left = 0
+            self.pooled = None
 
 
 def main(p1=None, p2=None, ball=None, ai=None, speed=15):
+    pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     
     pygame.display.set_caption("Pong AI")
     pygame.display.flip()
     
-    game = Game(speed, screen, ai)
+    # the left model train() saves, greedy
+    left_ai = load_policy(LEFT_MODEL_PATH) if type(p1) == AI_player else None
+
+    game = Game(speed, screen, ai, left_ai=left_ai)
     
     if type(p1) == AI_player:
         game.p1 = p1 if p1 else game.p1
         game.p1.screen = screen
         
-        with open("left_paddle_new_change_state2.pkl", "rb") as f:
-            left_ai = pickle.load(f)
-            game.left_ai = left_ai
-        
         
     # game.p2 = p2 if p2 else game.p2
     # game.ball = ball if ball else game.ball
@@ -303,18 +268,30 @@ def main(p1=None, p2=None, ball=None, ai=None, speed=15):
     # game.p2.screen = screen
     # game.ball.screen = screen
         
-    running = True
-    while game.win() == 0:
-        screen.fill(background_color)
+    run(game)
+    if game.win():
+        print(f"PLAYER {game.win()} WON")
+
 
+def run(game, sim_rate=SIM_RATE, fps=TARGET_FPS):
+    # Fixed-timestep loop: the simulation advances sim_rate steps per second
+    # of wall time whatever the frame rate, and the screen is redrawn at
+    # most `fps` times a second in between.
+    clock = pygame.time.Clock()
+    step = 1 / sim_rate
+    behind = 0
+
+    while game.win() == 0:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                running = False
+                return
 
-        game.update_all()
-        pygame.display.flip()
+        behind += min(clock.tick(fps) / 1000, MAX_FRAME_TIME)
+        while behind >= step and game.win() == 0:
+            game.update_all(draw=False)
+            behind -= step
 
-    print(f"PLAYER {game.win()} WON")
+        game.render()
     
         
 if __name__ == "__main__":
@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import collections
+import os
+import socket
+import stat
+import sys
+import time
+
+import numpy as np
+
+from mapped_policy import MappedPolicy
+from q_table import greedy
+
+# One process holds the model and answers every client.
+#
+#   python inference_server.py serve models/RIGHT_BEST_MODEL_YET.qtab --unix /tmp/pong.sock
+#   python inference_server.py bench --unix /tmp/pong.sock --clients 64
+#
+# The protocol is one line per request: the six state numbers separated by
+# spaces, answered by a line with the action's index. Requests that arrive while a
+# lookup is running are collected into the next batch (up to --max-batch,
+# waiting at most --max-delay-ms for more), and the whole batch is looked up
+# with one MappedPolicy.q_values_many() call. A line that isn't six integers,
+# or a lookup that fails, is answered with a line starting "error".
+
+STATE_FIELDS = 6
+
+
+def parse_request(line):
+    # -> the state as a list of ints, or None if it isn't one
+    try:
+        state = [int(x) for x in line.split()]
+    except ValueError:
+        return None
+
+    return state if len(state) == STATE_FIELDS else None
+
+
+class InferenceServer():
+    def __init__(self, policy, max_batch=256, max_delay=0.0005, report_every=10, seed=None):
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.report_every = report_every
+        self.rng = np.random.default_rng(seed)
+
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.connections = 0
+
+        # seconds from a request arriving to its answer being written
+        self.latencies = collections.deque(maxlen=100000)
+        self.requests = 0
+        self.batches = 0
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        self.connections += 1
+
+        try:
+            while line := await reader.readline():
+                start = time.perf_counter()
+                state = parse_request(line)
+                if state is None:
+                    reply = b"error: expected %d integers\n" % STATE_FIELDS
+                else:
+                    future = loop.create_future()
+                    self.pending.append((state, future))
+                    self.wakeup.set()
+
+                    try:
+                        reply = await future + b"\n"
+                        self.latencies.append(time.perf_counter() - start)
+                    except Exception as e:
+                        reply = f"error: {e}\n".encode()
+
+                # a client that sends without reading its replies waits
+                # here rather than having them pile up in memory
+                writer.write(reply)
+                await writer.drain()
+
+        except ConnectionResetError:
+            pass
+
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def batcher(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            # a lone client has nobody to share a batch with
+            if len(self.pending) < self.max_batch and self.max_delay and self.connections > 1:
+                await asyncio.sleep(self.max_delay)
+
+            while self.pending:
+                batch = self.pending[:self.max_batch]
+                del self.pending[:self.max_batch]
+
+                try:
+                    actions = self.choose_actions(np.array([state for state, future in batch], dtype=np.int64))
+                except Exception as e:
+                    # only this batch's requests fail; the server carries on
+                    for state, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                for (state, future), action in zip(batch, actions.tolist()):
+                    # the client may have gone away in the meantime
+                    if not future.done():
+                        future.set_result(b"%d" % action)
+
+                self.requests += len(batch)
+                self.batches += 1
+
+    def choose_actions(self, states):
+        # greedy, ties broken at random like Q_learning.choose_action
+        return greedy(self.policy.q_values_many(states), self.rng)
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch": self.requests / self.batches if self.batches else 0,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0,
+        }
+
+    async def reporter(self):
+        last_requests = self.requests
+        last_time = time.perf_counter()
+
+        while True:
+            await asyncio.sleep(self.report_every)
+
+            now = time.perf_counter()
+            stats = self.stats()
+            rate = (stats["requests"] - last_requests) / (now - last_time)
+            last_requests, last_time = stats["requests"], now
+
+            print(f"{rate:.0f} req/s  p50 {stats['p50_ms']:.3f}ms  p99 {stats['p99_ms']:.3f}ms  "
+                  f"mean batch {stats['mean_batch']:.1f}", file=sys.stderr)
+
+    async def serve(self, host=None, port=None, unix=None):
+        if unix:
+            # a socket file left behind by a server that didn't shut down
+            if os.path.exists(unix) and stat.S_ISSOCK(os.stat(unix).st_mode):
+                os.remove(unix)
+
+            server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+
+        tasks = [asyncio.create_task(self.batcher())]
+        if self.report_every:
+            tasks.append(asyncio.create_task(self.reporter()))
+
+        async with server:
+            await server.serve_forever()
+
+
+class RemotePolicy():
+    # choose_action() against a running server, so game.main() can use it in
+    # place of a local model
+    def __init__(self, host=None, port=None, unix=None):
+        if unix:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.file = self.sock.makefile("rb")
+        self.epsilon = False
+
+    def choose_action(self, state):
+        self.sock.sendall(" ".join(map(str, state)).encode() + b"\n")
+        reply = self.file.readline()
+        if reply.startswith(b"error"):
+            raise ValueError(reply.decode().strip())
+
+        return int(reply)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+async def bench_client(states, host, port, unix, latencies):
+    if unix:
+        reader, writer = await asyncio.open_unix_connection(unix)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    for state in states:
+        start = time.perf_counter()
+        writer.write(" ".join(map(str, state)).encode() + b"\n")
+        await reader.readline()
+        latencies.append(time.perf_counter() - start)
+
+    writer.close()
+
+
+async def bench(clients, requests, host=None, port=None, unix=None, seed=0):
+    # `clients` concurrent connections, each sending `requests` states one
+    # at a time; -> (requests/s, p50 ms, p99 ms) as the clients saw them
+    rng = np.random.default_rng(seed)
+    latencies = []
+
+    jobs = []
+    for c in range(clients):
+        ys = rng.integers(0, 68, (requests, 1))
+        ball = rng.integers(0, 80, (requests, 2))
+        signs = rng.choice([-1, 1], (requests, 2))
+        jobs.append(np.hstack([ys, ys - ball[:, 1:], ball, signs]).tolist())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bench_client(states, host, port, unix, latencies) for states in jobs))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return clients * requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched greedy inference over a local socket")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="load a .qtab model and answer clients")
+    serve_parser.add_argument("model")
+    serve_parser.add_argument("--max-batch", type=int, default=256)
+    serve_parser.add_argument("--max-delay-ms", type=float, default=0.5, help="how long to wait for a batch to fill")
+    serve_parser.add_argument("--report-every", type=float, default=10, help="seconds between latency reports (0: never)")
+
+    bench_parser = commands.add_parser("bench", help="load test a running server")
+    bench_parser.add_argument("--clients", type=int, default=32)
+    bench_parser.add_argument("--requests", type=int, default=1000, help="requests per client")
+
+    for p in (serve_parser, bench_parser):
+        p.add_argument("--unix", help="Unix socket path (instead of TCP)")
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = InferenceServer(MappedPolicy(args.model), args.max_batch, args.max_delay_ms / 1000, args.report_every)
+        print(f"serving {len(server.policy)} entries on {args.unix or f'{args.host}:{args.port}'}", file=sys.stderr)
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+
+    else:
+        rate, p50, p99 = asyncio.run(bench(args.clients, args.requests, args.host, args.port, args.unix))
+        print(f"{args.clients} clients: {rate:.0f} req/s  p50 {p50:.3f}ms  p99 {p99:.3f}ms")
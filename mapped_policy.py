@@ -0,0 +1,121 @@
+import bisect
+import mmap
+import random
+
+import numpy as np
+
+import model_io
+from state import BIN_SIZE, state_key, pack_many
+
+# memoryview formats for the value dtypes model_io writes
+VIEW_FORMATS = {"<f8": "d", "<f4": "f", "|i1": "b"}
+
+
+class MappedPolicy():
+    # Greedy, read-only view of a .qtab file. The file is memory-mapped and
+    # looked up in place (binary search over the sorted packed keys), so
+    # opening it costs nothing up front and every process mapping the same
+    # file shares one copy of it in the page cache.
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = model_io.read_header(f)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if header["key_format"] != "packed":
+            raise ValueError(f"{path}: only packed-key models can be memory-mapped")
+
+        self.header = header
+        self.actions = header["actions"]
+        self.epsilon = False
+
+        arrays = {}
+        for name, (dtype, shape) in model_io.section_layout(header).items():
+            offset, nbytes = header["sections"][name]
+            arrays[name] = np.frombuffer(self.mm, dtype=dtype, count=int(np.prod(shape)), offset=header["data_start"] + offset).reshape(shape)
+
+        self.keys = arrays["keys"]
+        self.values = arrays["values"]
+        self.present = arrays["present"]
+        # int8 values are stored divided by this; a pruned table may have
+        # merged its dropped entries into a non-zero default
+        self.scale = header.get("value_scale", 1)
+        self.default = header.get("default", 0)
+        # the states it was trained on, for whoever encodes states for it
+        self.bin_size = header.get("bin_size", BIN_SIZE)
+
+        # single lookups go through plain memoryviews: bisect over one is a
+        # few times quicker than a NumPy call per state
+        self.key_view = self.section_view("keys", "q")
+        if self.values.dtype.str in VIEW_FORMATS:
+            self.value_view = self.section_view("values", VIEW_FORMATS[self.values.dtype.str])
+        else:
+            # memoryview has no float16; slicing the array works the same
+            self.value_view = self.values.reshape(-1)
+
+    def section_view(self, name, fmt):
+        offset, nbytes = self.header["sections"][name]
+        start = self.header["data_start"] + offset
+        return memoryview(self.mm)[start:start + nbytes].cast(fmt)
+
+    def __len__(self):
+        # entries, like len(Q_learning.q)
+        return int(np.unpackbits(self.present).sum())
+
+    def find(self, state):
+        # a create_state tuple or a packed key, like the Q-tables take
+        key = state_key(state)
+        i = bisect.bisect_left(self.key_view, key)
+
+        if i < len(self.key_view) and self.key_view[i] == key:
+            return i
+
+        return -1
+
+    def q_values(self, state):
+        i = self.find(state)
+        if i < 0:
+            return [self.default] * len(self.actions)
+
+        n_actions = len(self.actions)
+        values = self.value_view[i * n_actions:(i + 1) * n_actions].tolist()
+        if self.scale != 1:
+            values = [v * self.scale for v in values]
+
+        # actions without an entry in the row are stored as 0; they're the default
+        present = int(self.present[i])
+        if present != (1 << n_actions) - 1:
+            values = [v if present >> a & 1 else self.default for a, v in enumerate(values)]
+
+        return values
+
+    def choose_action(self, state):
+        q_values = self.q_values(state)
+        best = max(q_values)
+
+        return random.choice([a for a, q in enumerate(q_values) if q == best])
+
+    def q_values_many(self, states):
+        # (n, 6) states, or a 1-D array of their packed keys -> (n, n_actions)
+        # values, the default where the state is unknown
+        states = np.asarray(states)
+        keys = states.astype(np.int64) if states.ndim == 1 else pack_many(states)
+        if len(self.keys) == 0:
+            return np.full((len(keys), len(self.actions)), self.default, dtype=np.float32)
+
+        index = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[index] == keys
+        values = self.values[index]
+        if self.scale != 1:
+            values = values * np.float32(self.scale)
+
+        present = (self.present[index][:, None] >> np.arange(len(self.actions), dtype=np.uint8)) & 1
+        return np.where(found[:, None] & (present == 1), values, self.default)
+
+    def close(self):
+        self.keys = self.values = self.present = None
+        self.key_view.release()
+        if isinstance(self.value_view, memoryview):
+            self.value_view.release()
+
+        self.value_view = None
+        self.mm.close()
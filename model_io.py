@@ -0,0 +1,262 @@
+import json
+import pickle
+
+import numpy as np
+
+from state import can_pack, pack_many, unpack_many
+
+# Q-table file layout (.qtab):
+#
+#   magic      8 bytes   b"PONGQTAB"
+#   version    uint32
+#   header     uint32 length, then that many bytes of UTF-8 JSON:
+#              hyperparameters, bin size, actions, key format, row count and
+#              where each section starts
+#   sections   each 64-byte aligned, offsets counted from the first one
+#     keys     int64[n] packed states, sorted ("packed" key format)
+#              or float64[n, fields] raw states ("raw", old float-state models)
+#     values   float32[n, n_actions], or whatever value_dtype says: float64,
+#              float16, or int8 quantized (value = stored * value_scale)
+#     present  uint8[n], bit i set when action i has an entry
+#     visits   uint32[n, n_actions] update counts, when any were counted
+#   raw_keys, raw_values, raw_present, raw_visits
+#              the same for the states of a packed table that don't pack
+#              (non-integral old float states), float64[raw_rows, fields]
+#              keys, unsorted; readers that only look packed states up can
+#              leave them out
+#
+# Everything is little-endian and fixed-width so the sections can be read or
+# memory-mapped in place.
+
+MAGIC = b"PONGQTAB"
+VERSION = 1
+ALIGN = 64
+
+
+def aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def group_by_state(items, n_actions):
+    rows = {}
+
+    for (state, a), value in items:
+        row = rows.get(state)
+        if row is None:
+            row = rows[state] = [[0.0] * n_actions, 0]
+
+        row[0][a] = value
+        row[1] |= 1 << a
+
+    return rows
+
+
+def quantize(values):
+    # -> (int8 values, scale) with values ~= int8 values * scale
+    peak = float(np.abs(values).max()) if values.size else 0
+    scale = peak / 127 if peak else 1.0
+    return np.round(values / scale).astype("i1"), scale
+
+
+def write_model(path, header, actions, items, value_dtype="<f4", visit_count=None):
+    # items: ((state tuple, action index), value) pairs, like Q-table entries()
+    # visit_count(state, action index): adds the visits section
+    rows = group_by_state(items, len(actions))
+    packed = [s for s in rows if can_pack(s)]
+    raw = [s for s in rows if not can_pack(s)]
+
+    if packed or not raw:
+        key_format = "packed"
+        keys = pack_many(np.array(packed, dtype=np.int64).reshape(-1, 6))
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order].astype("<i8")
+        states = [packed[i] for i in order] + raw
+        n = len(packed)
+    else:
+        # nothing packs: an old float-state model
+        key_format = "raw"
+        keys = np.array(raw, dtype="<f8").reshape(len(raw), -1)
+        states = raw
+        n = len(raw)
+        raw = []
+
+    values = np.array([rows[state][0] for state in states], dtype=np.float64).reshape(-1, len(actions))
+    present = np.array([rows[state][1] for state in states], dtype=np.uint8)
+
+    header = dict(header)
+    if np.dtype(value_dtype) == np.int8:
+        values, header["value_scale"] = quantize(values)
+    else:
+        values = values.astype(value_dtype)
+
+    visits = None
+    if visit_count:
+        visits = np.array([[visit_count(state, a) for a in range(len(actions))] for state in states], dtype="<u4").reshape(-1, len(actions))
+        # nothing counted (e.g. a model converted from a pickle): leave it out
+        if not visits.any():
+            visits = None
+
+    arrays = [("keys", keys), ("values", values[:n]), ("present", present[:n])]
+    if visits is not None:
+        arrays.append(("visits", visits[:n]))
+
+    if raw:
+        raw_keys = np.array(raw, dtype="<f8").reshape(len(raw), -1)
+        arrays += [("raw_keys", raw_keys), ("raw_values", values[n:]), ("raw_present", present[n:])]
+        if visits is not None:
+            arrays.append(("raw_visits", visits[n:]))
+
+        header["raw_rows"] = len(raw)
+
+    sections = {}
+    offset = 0
+    blobs = []
+    for name, array in arrays:
+        blob = np.ascontiguousarray(array).tobytes()
+        sections[name] = [offset, len(blob)]
+        blobs.append((offset, blob))
+        offset = aligned(offset + len(blob))
+
+    header.update({
+        "actions": list(actions),
+        "key_format": key_format,
+        "value_dtype": np.dtype(value_dtype).str,
+        "fields": int(keys.shape[1]) if key_format == "raw" else int(raw_keys.shape[1]) if raw else 6,
+        "rows": n,
+        "sections": sections,
+    })
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([VERSION, len(header_bytes)], dtype="<u4").tobytes())
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - f.tell()))
+
+        for offset, blob in blobs:
+            f.write(b"\0" * (data_start + offset - f.tell()))
+            f.write(blob)
+
+
+def read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a Q-table file")
+
+    version, header_len = np.frombuffer(f.read(8), dtype="<u4")
+    if version != VERSION:
+        raise ValueError(f"unsupported Q-table file version {version}")
+
+    header = json.loads(f.read(int(header_len)).decode("utf-8"))
+    header["data_start"] = aligned(len(MAGIC) + 8 + int(header_len))
+    return header
+
+
+def section_layout(header):
+    rows = header["rows"]
+    n_actions = len(header["actions"])
+
+    if header["key_format"] == "packed":
+        keys = ("<i8", (rows,))
+    else:
+        keys = ("<f8", (rows, header["fields"]))
+
+    layout = {
+        "keys": keys,
+        "values": (header.get("value_dtype", "<f4"), (rows, n_actions)),
+        "present": ("u1", (rows,)),
+    }
+    if "visits" in header["sections"]:
+        layout["visits"] = ("<u4", (rows, n_actions))
+
+    raw_rows = header.get("raw_rows", 0)
+    if raw_rows:
+        layout["raw_keys"] = ("<f8", (raw_rows, header["fields"]))
+        layout["raw_values"] = (layout["values"][0], (raw_rows, n_actions))
+        layout["raw_present"] = ("u1", (raw_rows,))
+        if "raw_visits" in header["sections"]:
+            layout["raw_visits"] = ("<u4", (raw_rows, n_actions))
+
+    return layout
+
+
+def read_sections(path):
+    # -> (header, {section name: array as stored})
+    with open(path, "rb") as f:
+        header = read_header(f)
+        f.seek(0)
+        data = f.read()
+
+    arrays = {}
+    for name, (dtype, shape) in section_layout(header).items():
+        offset, nbytes = header["sections"][name]
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=header["data_start"] + offset).reshape(shape)
+
+    return header, arrays
+
+
+def read_values(header, values):
+    # stored values -> floats
+    if "value_scale" in header:
+        return values.astype(np.float32) * np.float32(header["value_scale"])
+
+    return values
+
+
+def read_states(header, keys):
+    # keys section -> (n, fields) states
+    if header["key_format"] == "packed":
+        return unpack_many(keys)
+
+    return keys
+
+
+def read_rows(header, arrays):
+    # -> [(states as an (n, fields) array, values, present, visits or None)]:
+    # the main rows, then the raw ones of a packed table if it has any
+    groups = [(read_states(header, arrays["keys"]), read_values(header, arrays["values"]), arrays["present"], arrays.get("visits"))]
+    if header.get("raw_rows"):
+        groups.append((arrays["raw_keys"], read_values(header, arrays["raw_values"]), arrays["raw_present"], arrays.get("raw_visits")))
+
+    return groups
+
+
+def load_rows(table, header, arrays):
+    # every row of a file into a Q-table, over what it holds already
+    for states, values, present, visits in read_rows(header, arrays):
+        table.load_rows(states, values, present)
+        if visits is not None:
+            table.load_visits(states, visits)
+
+
+def read_model(path):
+    # -> (header, read_rows())
+    header, arrays = read_sections(path)
+    return header, read_rows(header, arrays)
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    # The old models are whole pickled Q_learning objects. Only let through
+    # the classes those are made of instead of whatever a pickle asks for.
+    def find_class(self, module, name):
+        if name == "Q_learning" and module in ("__main__", "ai"):
+            from ai import Q_learning
+            return Q_learning
+
+        if module == "q_table" and name in ("DictQTable", "DenseQTable"):
+            import q_table
+            return getattr(q_table, name)
+
+        if module == "state" and name == "StateEncoder":
+            from state import StateEncoder
+            return StateEncoder
+
+        if module in ("numpy", "numpy.core.multiarray", "numpy._core.multiarray") and name in ("dtype", "ndarray", "_reconstruct"):
+            return super().find_class(module, name)
+
+        raise pickle.UnpicklingError(f"refusing to unpickle {module}.{name}")
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return LegacyUnpickler(f).load()
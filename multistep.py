@@ -0,0 +1,140 @@
+from collections import deque
+
+# Multi-step updates for the Q-table agents. One-step Q-learning moves a
+# reward back one state per visit; these move it back up to n steps (or,
+# fading, as far as the traces reach) in one go.
+#
+# Both stand in for a Q_learning agent in play_episode() the way
+# replay.ReplayLearner does. play_episode() hands a step's rewards over in
+# several update() calls, one per source (a hit, a point, the distance
+# shaping), all for the same transition; they are summed into one reward
+# for that step, which is learned from once the next step starts (the next
+# choose_action()) or the episode ends. With n=1 or lambda=0 that is
+# one-step Q-learning on the summed reward.
+#
+# Returns never run across an exploratory action: a non-greedy choice cuts
+# them off there (Watkins), since what follows says nothing about the
+# greedy policy being learned.
+
+
+class MultiStepLearner():
+    def __init__(self, agent):
+        self.agent = agent
+        # [state, action, reward so far, next state] of the current step
+        self.pending = None
+
+    def __getattr__(self, name):
+        # see replay.ReplayLearner.__getattr__
+        if name == "agent":
+            raise AttributeError(name)
+
+        return getattr(self.agent, name)
+
+    def choose_action(self, state):
+        # a new step: the last one has all its rewards
+        self.flush()
+
+        action = self.agent.choose_action(state)
+        values = self.agent.q.q_values(state)
+        if values[action] < max(values):
+            self.cut()
+
+        return action
+
+    def update(self, old_state, new_state, reward, action):
+        self.agent.episode_reward += reward
+
+        pending = self.pending
+        if pending and pending[0] == old_state and pending[1] == action and pending[3] == new_state:
+            pending[2] += reward
+        else:
+            # a caller that doesn't choose its actions through here
+            self.flush()
+            self.pending = [old_state, action, reward, new_state]
+
+    def flush(self):
+        if self.pending:
+            self.learn(*self.pending)
+            self.pending = None
+
+    def end_episode(self):
+        self.flush()
+        self.cut()
+
+    def visit(self, key):
+        self.agent.q.add_visits({key: 1})
+
+
+class NStepLearner(MultiStepLearner):
+    # Q(s, a) += alpha * (r + gamma r' + ... + gamma^(n-1) r'' + gamma^n max Q(s_n) - Q(s, a)),
+    # each (s, a) updated n steps after it. At a cut the transitions
+    # still waiting get the shorter returns up to there.
+    def __init__(self, agent, n=4):
+        super().__init__(agent)
+        self.n = n
+        # (entry key, reward) of the last transitions, oldest first
+        self.window = deque()
+        self.last_state = None
+
+    def learn(self, state, action, reward, next_state):
+        self.window.append((self.agent.q.entry_key(state, action), reward))
+        self.last_state = next_state
+
+        if len(self.window) == self.n:
+            self.update_oldest()
+
+    def update_oldest(self):
+        q = self.agent.q
+        gamma = self.agent.gamma
+
+        ret = max(q.q_values(self.last_state))
+        for key, reward in reversed(self.window):
+            ret = reward + gamma * ret
+
+        key = self.window.popleft()[0]
+        old_q = q.get_entry(key)
+        q.set_entry(key, old_q + self.agent.alpha * (ret - old_q))
+        self.visit(key)
+
+    def cut(self):
+        while self.window:
+            self.update_oldest()
+
+
+class WatkinsLearner(MultiStepLearner):
+    # Watkins's Q(lambda) with replacing traces. Every TD error moves every
+    # traced entry by alpha * error * trace; traces fade by gamma * lambda a
+    # step and are dropped below `min_trace`, so only the last few dozen
+    # steps are ever held (at most `max_traces`, the oldest going first).
+    def __init__(self, agent, lam=0.8, min_trace=0.01, max_traces=1000):
+        super().__init__(agent)
+        self.lam = lam
+        self.min_trace = min_trace
+        self.max_traces = max_traces
+        # entry key -> trace, oldest first
+        self.traces = {}
+
+    def learn(self, state, action, reward, next_state):
+        agent = self.agent
+        q = agent.q
+        key = q.entry_key(state, action)
+
+        error = reward + agent.gamma * max(q.q_values(next_state)) - q.get_entry(key)
+
+        traces = self.traces
+        traces.pop(key, None)
+        traces[key] = 1
+        if len(traces) > self.max_traces:
+            del traces[next(iter(traces))]
+
+        step = agent.alpha * error
+        for k, trace in traces.items():
+            q.set_entry(k, q.get_entry(k) + step * trace)
+        self.visit(key)
+
+        fade = agent.gamma * self.lam
+        min_trace = self.min_trace
+        self.traces = {k: trace * fade for k, trace in traces.items() if trace * fade >= min_trace}
+
+    def cut(self):
+        self.traces = {}
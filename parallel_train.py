@@ -0,0 +1,160 @@
+import argparse
+import multiprocessing as mp
+import os
+import random
+import time
+
+from ai import GAME_SPEED, LEFT_MODEL_PATH, RIGHT_MODEL_PATH, derive_seed, load_or_create, play_episode
+
+# Self-play across processes. Every worker keeps its own copy of both agents
+# and plays `sync_every` episodes per round. At the end of a round it sends
+# back the entries it updated along with how many times it updated each.
+# The learner averages each entry over the workers that touched it, weighted
+# by those counts, and broadcasts the merged entries so every worker starts
+# the next round from the same tables.
+
+
+def decayed_epsilon(epsilon, agent, episodes):
+    # Q_learning.decay_epslion applied `episodes` times
+    for i in range(episodes):
+        if not epsilon or epsilon <= agent.min_epsilon:
+            break
+
+        epsilon *= agent.epsilon_decay
+
+    return epsilon
+
+
+def collect_updates(table):
+    return {key: (table.get_entry(key), count) for key, count in table.take_visits().items()}
+
+
+def merge_updates(table, worker_updates):
+    totals = {}
+    for updates in worker_updates:
+        for key, (value, count) in updates.items():
+            weighted, visits = totals.get(key, (0, 0))
+            totals[key] = (weighted + value * count, visits + count)
+
+    merged = {}
+    for key, (weighted, visits) in totals.items():
+        merged[key] = weighted / visits
+        table.set_entry(key, merged[key])
+
+    table.add_visits({key: visits for key, (weighted, visits) in totals.items()})
+    return merged
+
+
+def apply_entries(table, entries):
+    for key, value in entries.items():
+        table.set_entry(key, value)
+
+
+def worker(conn, left_q, right_q, seed):
+    random.seed(seed)
+
+    # whatever the learner already counted isn't ours to send back
+    left_q.q.take_visits()
+    right_q.q.take_visits()
+    game = None
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+
+        jobs, left_entries, right_entries = message
+        apply_entries(left_q.q, left_entries)
+        apply_entries(right_q.q, right_entries)
+
+        frames = 0
+        for left_epsilon, right_epsilon, game_seed in jobs:
+            left_q.epsilon = left_epsilon
+            right_q.epsilon = right_epsilon
+            game = play_episode(left_q, right_q, seed=game_seed, game=game)
+            frames += game.frames
+
+        conn.send((collect_updates(left_q.q), collect_updates(right_q.q), frames))
+
+    conn.close()
+
+
+def train_parallel(n, workers=None, sync_every=5, left_q=None, right_q=None, seed=0):
+    workers = workers or os.cpu_count()
+
+    if left_q is None:
+        left_q = load_or_create(LEFT_MODEL_PATH)
+
+    if right_q is None:
+        right_q = load_or_create(RIGHT_MODEL_PATH)
+
+    left_epsilon = left_q.epsilon
+    right_epsilon = right_q.epsilon
+
+    conns = []
+    processes = []
+    for w in range(workers):
+        parent_conn, child_conn = mp.Pipe()
+        process = mp.Process(target=worker, args=(child_conn, left_q, right_q, seed + w), daemon=True)
+        process.start()
+
+        conns.append(parent_conn)
+        processes.append(process)
+
+    episodes = 0
+    frames = 0
+    left_entries, right_entries = {}, {}
+    start = time.perf_counter()
+
+    while episodes < n:
+        # hand out the next block of global episode numbers, round-robin, so
+        # epsilon follows one schedule no matter how many workers there are
+        round_size = min(workers * sync_every, n - episodes)
+        jobs = [[] for w in range(workers)]
+        for i in range(round_size):
+            episode = episodes + i
+            jobs[i % workers].append((
+                decayed_epsilon(left_epsilon, left_q, episode),
+                decayed_epsilon(right_epsilon, right_q, episode),
+                derive_seed(seed, episode),
+            ))
+
+        active = [w for w in range(workers) if jobs[w]]
+        for w in active:
+            conns[w].send((jobs[w], left_entries, right_entries))
+
+        results = [conns[w].recv() for w in active]
+        left_entries = merge_updates(left_q.q, [r[0] for r in results])
+        right_entries = merge_updates(right_q.q, [r[1] for r in results])
+
+        episodes += round_size
+        frames += sum(r[2] for r in results)
+
+        elapsed = time.perf_counter() - start
+        print(f"Trained {episodes}/{n} games ({episodes / elapsed:.2f} games/s, {frames / elapsed:.0f} frames/s)")
+
+    # workers that sat out the last round are behind, but they are done anyway
+    for conn in conns:
+        conn.send(None)
+
+    for process in processes:
+        process.join()
+
+    left_q.epsilon = decayed_epsilon(left_epsilon, left_q, n)
+    right_q.epsilon = decayed_epsilon(right_epsilon, right_q, n)
+
+    return left_q, right_q
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel self-play training")
+    parser.add_argument("games", type=int, nargs="?", default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sync-every", type=int, default=5, help="games per worker between merges")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    left, right = train_parallel(args.games, args.workers, args.sync_every, seed=args.seed)
+
+    left.save(LEFT_MODEL_PATH)
+    right.save(RIGHT_MODEL_PATH)
@@ -0,0 +1,243 @@
+import math
+import random
+
+# Pure-Python Pong core. No pygame in here: training drives these classes
+# directly and game.py subclasses them to draw on top.
+
+WIDTH, HEIGHT = 1000, 800
+PADDLE_WIDTH = 30
+PADDLE_HEIGHT = 130
+BALL_RADIUS = 10
+POINTS_TO_WIN = 5
+
+LEFT_PADDLE_X = 30
+RIGHT_PADDLE_X = 930
+PADDLE_START_Y = HEIGHT // 2 - 100
+
+# pygame.time.Clock().tick(60) on a fresh clock comes back as ~16-17ms; the
+# simulation always steps by exactly this, whatever the clock says
+FRAME_DT = 1 / 60
+
+DIRECTIONS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+# Paddle actions, as indices into ai.ACTIONS
+UP, DOWN, STAY = 0, 1, 2
+
+
+def make_rng(seed=None):
+    # None keeps sharing the global `random` module (random.seed() still
+    # decides everything); anything else gets a generator of its own
+    return random if seed is None else random.Random(seed)
+
+
+def clamp(a, b, c):
+    if a < b:   return b
+    elif a > c: return c
+    else:       return a
+
+
+class Rect():
+    # Just enough of pygame.Rect for the physics: integer x/y like pygame
+    # (it truncates floats), so collisions see the same paddle positions.
+    def __init__(self, x, y, width, height):
+        self.update(x, y, width, height)
+
+    def update(self, x, y, width, height):
+        self.x = int(x)
+        self.y = int(y)
+        self.width = int(width)
+        self.height = int(height)
+
+    @property
+    def top(self):
+        return self.y
+
+    @property
+    def bottom(self):
+        return self.y + self.height
+
+
+class Paddle():
+    def __init__(self, speed, player, x, y):
+        self.speed = speed
+        self.x = x
+        self.y = y
+        self.start_y = y
+        self.player = player
+        self.rect = self.make_rect()
+
+    def make_rect(self):
+        return Rect(self.x, self.y, PADDLE_WIDTH, PADDLE_HEIGHT)
+
+    def move(self, action, repeat_action_n):
+        # the steps are still added one at a time (the float rounding is part
+        # of the trajectory), but the border check only matters once: a move
+        # goes one way, so once it hits a border it stays there
+        if action == UP:
+            step = -self.speed
+
+        elif action == DOWN:
+            step = self.speed
+
+        else:
+            return
+
+        y = self.y
+        for i in range(repeat_action_n):
+            y += step
+
+        self.y = y
+        self.check_borders()
+
+    def check_borders(self):
+        if self.y >= HEIGHT - PADDLE_HEIGHT:
+            self.y = HEIGHT - PADDLE_HEIGHT
+
+        elif self.y <= 0:
+            self.y = 0
+
+    def update(self):
+        self.rect.update(self.x, self.y, PADDLE_WIDTH, PADDLE_HEIGHT)
+
+    def reset(self):
+        self.y = self.start_y
+        self.rect.update(self.x, self.y, PADDLE_WIDTH, PADDLE_HEIGHT)
+
+
+class Ball():
+    def __init__(self, speed, rng=random):
+        self.speed = speed
+        self.radis = BALL_RADIUS
+        self.rng = rng
+        self.reset()
+
+    def reset(self):
+        # back to a freshly made ball, drawing from the rng the same way
+        self.x = WIDTH // 2
+        self.y = HEIGHT // 2
+
+        self.direction = self.rng.choice(DIRECTIONS)
+
+        self.Vx = self.speed * self.direction[0]
+        self.Vy = self.speed * self.direction[1]
+
+        self.is_start = True
+
+    def move_ball(self):
+        if self.is_start:
+            self.direction = self.rng.choice(DIRECTIONS)
+
+            self.Vx *= self.direction[0]
+            self.Vy *= self.direction[1]
+
+        self.is_start = False
+        self.x += self.Vx
+        self.y += self.Vy
+
+    def update(self, rect1, rect2):
+        self.move_ball()
+        return self.check_collisions(rect1, rect2)
+
+    def check_collisions(self, rect1, rect2):
+        ball_point = (self.x, self.y)
+
+        if self.y <= 0 or self.y >= HEIGHT:
+            self.Vy *= -1
+
+        for player, rect in ((1, rect1), (2, rect2)):
+            near_x = clamp(self.x, rect.x, rect.x + PADDLE_WIDTH)
+            near_y = clamp(self.y, rect.y, rect.y + PADDLE_HEIGHT)
+
+            dist = self.distance(ball_point, (near_x, near_y))
+
+            if dist <= self.radis:
+                if self.y <= rect.y or self.y >= rect.y + PADDLE_HEIGHT:
+                    self.Vy *= -1
+
+                else:
+                    self.Vx *= -1
+
+                return player
+
+    def did_hit_sides(self):
+        # left wall collision: -1
+        # right wall collision: 1
+        if self.x <= -(self.radis * 2): return -1
+        if self.x >= WIDTH + self.radis * 2: return 1
+
+    def re_render_ball_after_loss(self):
+        self.is_start = True
+
+        self.x = WIDTH // 2
+        self.y = HEIGHT // 2
+
+    def distance(self, pt1, pt2):
+        return math.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
+
+
+class Game():
+    def __init__(self, speed, dt=FRAME_DT, seed=None):
+        self.dt = dt
+        self.rng = make_rng(seed)
+
+        self.p1 = self.make_player(speed * self.dt, 1, LEFT_PADDLE_X, PADDLE_START_Y)
+        self.p2 = self.make_player(speed * self.dt, 2, RIGHT_PADDLE_X, PADDLE_START_Y)
+        self.ball = self.make_ball(speed * self.dt)
+
+        self.p1_points = 0
+        self.p2_points = 0
+        self.points_to_win = POINTS_TO_WIN
+
+        self.frames = 0
+
+    def make_player(self, speed, player, x, y):
+        return Paddle(speed, player, x, y)
+
+    def make_ball(self, speed):
+        return Ball(speed, self.rng)
+
+    def reset(self, seed=None):
+        # start a new game on the same objects. With a seed this is the same
+        # as a new Game(speed, dt, seed); without one the rng carries on
+        if seed is not None:
+            self.rng = make_rng(seed)
+            self.ball.rng = self.rng
+
+        self.p1.reset()
+        self.p2.reset()
+        self.ball.reset()
+
+        self.p1_points = 0
+        self.p2_points = 0
+        self.frames = 0
+
+    def update_points(self):
+        wall = self.ball.did_hit_sides()
+        if wall == -1:
+            self.p2_points += 1
+            self.ball.re_render_ball_after_loss()
+
+        if wall == 1:
+            self.p1_points += 1
+            self.ball.re_render_ball_after_loss()
+
+        return wall
+
+    def update_all(self):
+        self.ball.update(self.p1.rect, self.p2.rect)
+        self.update_points()
+
+        self.p1.update()
+        self.p2.update()
+
+        self.frames += 1
+
+    def win(self):
+        if self.p1_points == self.points_to_win:
+            return 1
+
+        elif self.p2_points == self.points_to_win:
+            return 2
+
+        else:
+            return 0
@@ -1,21 +1,27 @@
 from game import *
 from ai import *
-import pickle
+from mapped_policy import MappedPolicy
+from inference_server import RemotePolicy
 import pygame
+import sys
 
 GAME_SPEED = 20
 
 if __name__ == "__main__":
-    with open("best_right_paddle_model.pkl", "rb") as f:
-        ai = pickle.load(f)
-        ai.epsilon = False
+    # greedy, straight off the mapped file, or from a running
+    # inference_server.py when given its Unix socket
+    if len(sys.argv) > 1:
+        ai = RemotePolicy(unix=sys.argv[1])
+    else:
+        ai = MappedPolicy("models/RIGHT_BEST_MODEL_YET.qtab")
 
-        # print(len(ai.q))
-        # screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        
-                
-        # p1 = AI_player(GAME_SPEED, None, 1, 30, HEIGHT // 2 - 100) # left paddle
-        # p2 = AI_player(GAME_SPEED, None, 2, 930, HEIGHT // 2 - 100) # right paddle
+    # print(len(ai.q))
+    # screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    
+            
+    # p1 = AI_player(GAME_SPEED, None, 1, 30, HEIGHT // 2 - 100) # left paddle
+    # p2 = AI_player(GAME_SPEED, None, 2, 930, HEIGHT // 2 - 100) # right paddle
 
-        print(len(ai.q))
-        main(None, None, None, ai, 15)
\ No newline at end of file
+    if hasattr(ai, "__len__"):
+        print(len(ai))
+    main(None, None, None, ai, 15)
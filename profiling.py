@@ -0,0 +1,88 @@
+import csv
+import json
+import time
+
+PHASES = ("physics", "encode", "act", "learn", "reward")
+
+
+class NullProfiler():
+    # What train() uses when profiling is off: every hook is an empty call.
+    def begin_episode(self, left_q, right_q):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def step(self):
+        pass
+
+    def end_episode(self, episode, game, left_q, right_q):
+        pass
+
+
+class PhaseProfiler(NullProfiler):
+    # Lap timer: lap(phase) charges the time since the previous lap to that
+    # phase, so each phase boundary costs a single perf_counter() call.
+    def __init__(self):
+        self.episodes = []
+
+    def begin_episode(self, left_q, right_q):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.laps = dict.fromkeys(PHASES, 0)
+        self.steps = 0
+        self.left_size = len(left_q.q)
+        self.right_size = len(right_q.q)
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.seconds[phase] += now - self.last
+        self.laps[phase] += 1
+        self.last = now
+
+    def step(self):
+        self.steps += 1
+
+    def end_episode(self, episode, game, left_q, right_q):
+        seconds = time.perf_counter() - self.start
+
+        record = {
+            "episode": episode,
+            "steps": self.steps,
+            "frames": game.frames,
+            "seconds": seconds,
+            "steps_per_sec": self.steps / seconds if seconds else 0,
+            "left_q_size": len(left_q.q),
+            "right_q_size": len(right_q.q),
+            "left_q_growth": len(left_q.q) - self.left_size,
+            "right_q_growth": len(right_q.q) - self.right_size,
+        }
+        for phase in PHASES:
+            record[f"{phase}_s"] = self.seconds[phase]
+            record[f"{phase}_laps"] = self.laps[phase]
+
+        self.episodes.append(record)
+        return record
+
+    def summary(self):
+        total = sum(r["seconds"] for r in self.episodes)
+        steps = sum(r["steps"] for r in self.episodes)
+
+        lines = [f"{len(self.episodes)} episodes, {steps} steps in {total:.2f}s ({steps / total if total else 0:.0f} steps/s)"]
+        for phase in PHASES:
+            seconds = sum(r[f"{phase}_s"] for r in self.episodes)
+            lines.append(f"  {phase:8} {seconds:8.3f}s {seconds / total if total else 0:6.1%}")
+
+        return "\n".join(lines)
+
+    def write(self, path):
+        # .csv gets one row per episode, anything else a JSON list
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(self.episodes[0]) if self.episodes else [])
+                writer.writeheader()
+                writer.writerows(self.episodes)
+
+        else:
+            with open(path, "w") as f:
+                json.dump(self.episodes, f, indent=2)
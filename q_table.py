@@ -0,0 +1,453 @@
+import collections
+
+import numpy as np
+
+from state import StateEncoder, FIELD_OFFSET, can_pack, int_state, pack_state, pack_many, unpack_state, state_key
+
+
+def greedy(q_values, rng):
+    # (n, n_actions) -> index of the best action per row, ties broken at
+    # random: random numbers on the tied entries, zero elsewhere, argmax
+    best = q_values == q_values.max(axis=1, keepdims=True)
+    return np.argmax(best * rng.random(q_values.shape), axis=1)
+
+
+class DictQTable(dict):
+    # The original table, now keyed by one int per entry: the packed state
+    # (state.pack_state) times the number of actions plus the action's
+    # index, instead of a (state tuple, action name) pair. Still a plain
+    # dict underneath so len() and `in` keep working.
+    #
+    # States can be passed as create_state tuples or as their packed keys.
+    # States that don't pack (the float states of the oldest models) are
+    # kept under (state tuple, action index) so those files still load and
+    # save; create_state never makes one, so lookups never meet them.
+    def __init__(self, actions, *args):
+        super().__init__(*args)
+        self.actions = actions
+        self.n_actions = len(actions)
+        # entry key -> number of updates
+        self.visits = {}
+        # keys written since the last take_dirty()
+        self.dirty = set()
+        # the value of every entry that isn't in the table
+        self.default = 0
+
+    @classmethod
+    def from_legacy(cls, actions, items):
+        # {(state tuple, action name): value}, as pickled before packed keys
+        table = cls(actions)
+        action_index = {a: i for i, a in enumerate(actions)}
+        items = list(items)
+
+        states = [int_state(tuple(state)) for (state, action), value in items]
+        if states and all(len(state) == 6 for state in states):
+            fields = np.array(states)
+            # create_state models: pack them all at once
+            if (fields.dtype.kind == "i"
+                    and ((fields[:, :4] >= -FIELD_OFFSET) & (fields[:, :4] < FIELD_OFFSET)).all()
+                    and np.isin(fields[:, 4:], (-1, 1)).all()):
+                keys = (pack_many(fields) * table.n_actions).tolist()
+                table.update((key + action_index[action], value) for key, ((state, action), value) in zip(keys, items))
+                return table
+
+        for state, ((s, action), value) in zip(states, items):
+            table[table.entry_key(state, action_index[action])] = value
+
+        return table
+
+    def entry_key(self, state, action):
+        if type(state) is int:
+            return state * self.n_actions + action
+
+        if can_pack(state):
+            return pack_state(state) * self.n_actions + action
+
+        return (state, action)
+
+    def split_key(self, key):
+        # entry key -> (state tuple, action index)
+        if type(key) is tuple:
+            return key
+
+        state, action = divmod(key, self.n_actions)
+        return unpack_state(state), action
+
+    def ensure(self, state):
+        base = state_key(state) * self.n_actions
+        for a in range(self.n_actions):
+            self.setdefault(base + a, self.default)
+
+    def get_q(self, state, action):
+        return self.get(state_key(state) * self.n_actions + action, self.default)
+
+    def set_q(self, state, action, value):
+        key = state_key(state) * self.n_actions + action
+        self[key] = value
+        self.dirty.add(key)
+
+    def q_values(self, state):
+        base = (state if type(state) is int else pack_state(state)) * self.n_actions
+        get = self.get
+        return [get(key, self.default) for key in range(base, base + self.n_actions)]
+
+    def state_keys(self, states):
+        # an (n, 6) array of states, or a 1-D array of their pack_state()
+        # keys -> the keys
+        states = np.asarray(states)
+        return states.astype(np.int64) if states.ndim == 1 else pack_many(states)
+
+    def q_values_many(self, states):
+        # states as state_keys() takes them -> (n, n_actions) array
+        get = self.get
+        default = self.default
+        n = self.n_actions
+        values = [get(base + a, default) for base in (self.state_keys(states) * n).tolist() for a in range(n)]
+        return np.array(values, dtype=np.float64).reshape(-1, n)
+
+    def td_update(self, old_state, action, reward, new_state, alpha, gamma):
+        # only the updated entry is stored: filling in the rest of both
+        # states with zeros (what ensure() does) just grew the table
+        key = (old_state if type(old_state) is int else pack_state(old_state)) * self.n_actions + action
+        old_q = self.get(key, self.default)
+        future_rewards = max(self.q_values(new_state))
+        self.set_entry(key, old_q + alpha * (reward + gamma * future_rewards - old_q))
+        self.visits[key] = self.visits.get(key, 0) + 1
+
+    def td_update_batch(self, states, actions, rewards, next_states, dones, alpha, gamma, weights=None):
+        # the TD rule over arrays of transitions, all measured against the
+        # table as it was before the batch; a (state, action) that comes up
+        # more than once moves by its average error. -> the TD errors
+        keys = (self.state_keys(states) * self.n_actions + actions).tolist()
+
+        old_q = np.array([self.get_entry(key) for key in keys])
+        future = self.q_values_many(next_states).max(axis=1)
+        errors = rewards + gamma * future * ~dones - old_q
+
+        steps = alpha * errors if weights is None else alpha * weights * errors
+        totals = {}
+        for key, step in zip(keys, steps.tolist()):
+            total, count = totals.get(key, (0, 0))
+            totals[key] = (total + step, count + 1)
+
+        for key, (total, count) in totals.items():
+            self.set_entry(key, self.get_entry(key) + total / count)
+            self.visits[key] = self.visits.get(key, 0) + count
+
+        return errors
+
+    # Entries by key, for shipping updates between processes. Keys are
+    # entry keys here and flat array positions in DenseQTable.
+    def take_visits(self):
+        visits = self.visits
+        self.visits = {}
+        return visits
+
+    def add_visits(self, visits):
+        for key, count in visits.items():
+            self.visits[key] = self.visits.get(key, 0) + count
+
+    def get_entry(self, key):
+        return self[key] if key in self else self.default
+
+    def set_entry(self, key, value):
+        self[key] = value
+        self.dirty.add(key)
+
+    def visit_count(self, state, action):
+        return self.visits.get(self.entry_key(state, action), 0)
+
+    def load_visits(self, states, counts):
+        # counts: (n, n_actions) lined up with states, as saved in a .qtab;
+        # they replace what was counted for those states
+        for key, count in zip(self.row_keys(states), counts.ravel().tolist()):
+            if count:
+                self.visits[key] = count
+            else:
+                self.visits.pop(key, None)
+
+    def prune(self, min_visits=None, merge=False):
+        # Drop entries that hold the default value anyway and, with
+        # min_visits, those updated fewer times than that. merge: the
+        # default becomes the mean of the rare entries dropped, so they
+        # still count for something. -> number of entries dropped
+        rare = []
+        if min_visits:
+            rare = [key for key in self if self.visits.get(key, 0) < min_visits]
+
+        if merge and rare:
+            self.default = sum(self[key] for key in rare) / len(rare)
+
+        for key in rare:
+            del self[key]
+
+        idle = [key for key, value in self.items() if value == self.default]
+        for key in idle:
+            del self[key]
+
+        for key in rare + idle:
+            self.visits.pop(key, None)
+            self.dirty.discard(key)
+
+        return len(rare) + len(idle)
+
+    def take_dirty(self):
+        # -> ((state, action index), value) for everything written since last time
+        dirty = self.dirty
+        self.dirty = set()
+        return [(self.split_key(key), self[key]) for key in dirty if key in self]
+
+    def entries(self):
+        # -> ((state, action index), value) for every entry, for model files
+        split_key = self.split_key
+        return ((split_key(key), value) for key, value in self.items())
+
+    def row_keys(self, states):
+        # the entry keys of every action of each of an (n, fields) array of
+        # states, row by row
+        if states.dtype.kind == "i":
+            # packed in the file, so they pack here too
+            keys = pack_many(states)[:, None] * self.n_actions + np.arange(self.n_actions)
+            return keys.ravel().tolist()
+
+        # raw float states: the integral ones are create_state states after
+        # all and pack like them
+        return [self.entry_key(int_state(state), a) for state in map(tuple, states.tolist()) for a in range(self.n_actions)]
+
+    def load_rows(self, states, values, present):
+        keys = self.row_keys(states)
+        mask = (present[:, None] >> np.arange(self.n_actions, dtype=np.uint8)) & 1
+
+        if mask.all():
+            self.update(zip(keys, values.ravel().tolist()))
+        else:
+            mask = mask.ravel().astype(bool)
+            self.update((key, value) for key, value, m in zip(keys, values.ravel().tolist(), mask.tolist()) if m)
+
+
+class DenseQTable():
+    # [n_states, n_actions] array indexed through a StateEncoder. np.zeros
+    # hands back untouched pages lazily, so only the parts of the state space
+    # that training actually reaches take up memory.
+    def __init__(self, actions, encoder=None, dtype=np.float32):
+        self.actions = actions
+        self.encoder = encoder or StateEncoder()
+
+        self.table = np.zeros((self.encoder.n_states, len(actions)), dtype=dtype)
+        self.seen = np.zeros(self.encoder.n_states, dtype=bool)
+        self.visits = np.zeros(self.table.shape, dtype=np.uint32)
+        self.dirty = np.zeros(self.encoder.n_states, dtype=bool)
+        # unseen rows are zeros in the array, so this one stays 0
+        self.default = 0
+
+    def __len__(self):
+        # entries, to line up with len() of the dict table
+        return int(self.seen.sum()) * len(self.actions)
+
+    def ensure(self, state):
+        self.seen[self.encoder.encode(state)] = True
+
+    def get_q(self, state, action):
+        return self.table.item(self.encoder.encode(state), action)
+
+    def set_q(self, state, action, value):
+        index = self.encoder.encode(state)
+        self.seen[index] = True
+        self.dirty[index] = True
+        self.table[index, action] = value
+
+    def q_values(self, state):
+        # tolist() is several times quicker than NumPy scalar reductions here
+        return self.table[self.encoder.encode(state)].tolist()
+
+    def state_rows(self, states):
+        # an (n, 6) array of states, or a 1-D array that already holds
+        # their StateEncoder indices -> the indices
+        states = np.asarray(states)
+        return states if states.ndim == 1 else self.encoder.encode_many(states)
+
+    def q_values_many(self, states):
+        return self.table[self.state_rows(states)]
+
+    def td_update(self, old_state, action, reward, new_state, alpha, gamma):
+        old_index = self.encoder.encode(old_state)
+        new_index = self.encoder.encode(new_state)
+        self.seen[old_index] = True
+
+        old_q = self.table.item(old_index, action)
+        future_rewards = max(self.table[new_index].tolist())
+        self.table[old_index, action] = old_q + alpha * (reward + gamma * future_rewards - old_q)
+        self.visits[old_index, action] += 1
+        self.dirty[old_index] = True
+
+    def td_update_batch(self, states, actions, rewards, next_states, dones, alpha, gamma, weights=None):
+        # see DictQTable.td_update_batch
+        old_index = self.state_rows(states)
+        new_index = self.state_rows(next_states)
+        self.seen[old_index] = True
+
+        old_q = self.table[old_index, actions].astype(np.float64)
+        future = self.table[new_index].max(axis=1)
+        errors = rewards + gamma * future * ~dones - old_q
+
+        steps = alpha * errors if weights is None else alpha * weights * errors
+        flat = old_index * len(self.actions) + actions
+        keys, inverse, counts = np.unique(flat, return_inverse=True, return_counts=True)
+        totals = np.bincount(inverse, weights=steps)
+
+        self.table.reshape(-1)[keys] += totals / counts
+        self.visits.reshape(-1)[keys] += counts.astype(np.uint32)
+        self.dirty[old_index] = True
+
+        return errors
+
+    def take_visits(self):
+        visits = self.visits.reshape(-1)
+        keys = np.flatnonzero(visits)
+        counts = visits[keys].tolist()
+        visits[keys] = 0
+        return dict(zip(keys.tolist(), counts))
+
+    def add_visits(self, visits):
+        flat = self.visits.reshape(-1)
+        for key, count in visits.items():
+            flat[key] += count
+
+    def entry_key(self, state, action):
+        return self.encoder.encode(state) * len(self.actions) + action
+
+    def get_entry(self, key):
+        return self.table.item(key)
+
+    def set_entry(self, key, value):
+        self.seen[key // len(self.actions)] = True
+        self.dirty[key // len(self.actions)] = True
+        self.table.reshape(-1)[key] = value
+
+    def visit_count(self, state, action):
+        return self.visits.item(self.encoder.encode(state), action)
+
+    def load_visits(self, states, counts):
+        self.visits[self.encoder.encode_many(states)] = counts
+
+    def prune(self, min_visits=None, merge=False):
+        # DictQTable.prune, except the default can't move off 0 without
+        # writing every unseen row; dropped entries go back to 0 and rows
+        # left all zero stop counting as seen
+        if merge:
+            raise ValueError("the dense backend can't merge pruned entries into a default")
+
+        rows = np.flatnonzero(self.seen)
+        values = self.table[rows]
+        rare = np.zeros(values.shape, bool)
+
+        if min_visits:
+            visits = self.visits[rows]
+            rare = (visits < min_visits) & (values != 0)
+            values[rare] = 0
+            visits[rare] = 0
+            self.table[rows] = values
+            self.visits[rows] = visits
+
+        # what's dropped: the rare entries zeroed, and every entry of a row
+        # that stops counting as seen
+        empty = (values == 0).all(axis=1)
+        self.seen[rows[empty]] = False
+        return int(rare[~empty].sum()) + int(empty.sum()) * values.shape[1]
+
+    def take_dirty(self):
+        rows = np.flatnonzero(self.dirty)
+        self.dirty[rows] = False
+        return list(self.rows_items(rows))
+
+    def load_rows(self, states, values, present):
+        if states.dtype.kind == "f":
+            raise ValueError("the dense backend needs integer create_state states")
+
+        index = self.encoder.encode_many(states)
+        self.table[index] = values
+        self.seen[index] = True
+
+    def entries(self):
+        return self.rows_items(np.flatnonzero(self.seen))
+
+    def rows_items(self, rows):
+        for index, values in zip(rows.tolist(), self.table[rows].tolist()):
+            state = self.encoder.decode(index)
+            for action, value in enumerate(values):
+                yield (state, action), value
+
+
+class BoundedQTable(DictQTable):
+    # DictQTable holding at most `max_states` states: updating a state makes
+    # it the most recent, and past the limit the least recently updated
+    # state is evicted along with its entries and visit counts.
+    def __init__(self, actions, max_states, *args):
+        super().__init__(actions, *args)
+        self.max_states = max_states
+        # packed states (or raw state tuples), least recent first
+        self.recent = collections.OrderedDict()
+        # states evicted since the last take_dirty(); a checkpoint delta
+        # only has the entries written, so it can't carry these
+        self.evictions = 0
+
+    def state_of(self, key):
+        return key[0] if type(key) is tuple else key // self.n_actions
+
+    def touch(self, state):
+        recent = self.recent
+        if state in recent:
+            recent.move_to_end(state)
+            return
+
+        recent[state] = None
+        if len(recent) > self.max_states:
+            self.evict(recent.popitem(last=False)[0])
+
+    def evict(self, state):
+        for action in range(self.n_actions):
+            key = (state, action) if type(state) is tuple else state * self.n_actions + action
+            self.pop(key, None)
+            self.visits.pop(key, None)
+            self.dirty.discard(key)
+
+        self.evictions += 1
+
+    def take_dirty(self):
+        self.evictions = 0
+        return super().take_dirty()
+
+    def set_q(self, state, action, value):
+        self.set_entry(state_key(state) * self.n_actions + action, value)
+
+    def set_entry(self, key, value):
+        self.touch(self.state_of(key))
+        super().set_entry(key, value)
+
+    def load_rows(self, states, values, present):
+        super().load_rows(states, values, present)
+        for key in list(self):
+            self.touch(self.state_of(key))
+
+    def prune(self, min_visits=None, merge=False):
+        dropped = super().prune(min_visits, merge)
+        kept = {self.state_of(key) for key in self}
+        for state in [s for s in self.recent if s not in kept]:
+            del self.recent[state]
+
+        return dropped
+
+
+def make_q_table(backend, actions, encoder=None, max_states=None, dtype=np.float32):
+    # max_states: bound the dict table (BoundedQTable)
+    # dtype: what the dense table stores values as (np.float16 halves it)
+    if backend == "dict":
+        return BoundedQTable(actions, max_states) if max_states else DictQTable(actions)
+
+    elif backend == "dense":
+        if max_states:
+            raise ValueError("the dense backend is already fixed-size; max_states is for the dict backend")
+
+        return DenseQTable(actions, encoder, dtype)
+
+    raise ValueError(f"unknown Q-table backend: {backend!r}")
@@ -0,0 +1,124 @@
+import random
+
+import numpy as np
+
+from state import unpack_state
+
+# Experience replay. Transitions go into a fixed-size ring buffer of NumPy
+# arrays instead of being applied once and dropped, and learning happens in
+# batches sampled from it, so every transition can be learned from many
+# times and the TD rule runs over arrays rather than one call per step.
+
+STATE_SIZE = 6
+
+
+class ReplayBuffer():
+    # prioritized: sample in proportion to |TD error| ** alpha (new
+    # transitions get the current maximum so they are seen at least once)
+    # and correct for it with importance weights ** beta
+    def __init__(self, capacity, prioritized=False, alpha=0.6, beta=0.4, seed=None):
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        # any seed random.Random takes, like the rest of a seeded run
+        self.rng = np.random.default_rng(None if seed is None else random.Random(seed).getrandbits(64))
+
+        self.states = np.zeros((capacity, STATE_SIZE), dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_states = np.zeros((capacity, STATE_SIZE), dtype=np.int64)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.priorities = np.zeros(capacity, dtype=np.float64)
+
+        self.size = 0
+        self.position = 0
+        self.max_priority = 1.0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done=False):
+        # action: index into ai.ACTIONS
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.priorities[i] = self.max_priority
+
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def mark_done(self):
+        # the episode ended on the last transition added
+        if self.size:
+            self.dones[self.position - 1] = True
+
+    def sample(self, batch_size):
+        # -> (indices, importance weights or None)
+        if not self.prioritized:
+            return self.rng.integers(0, self.size, batch_size), None
+
+        p = self.priorities[:self.size] ** self.alpha
+        p /= p.sum()
+        indices = self.rng.choice(self.size, batch_size, p=p)
+
+        weights = (self.size * p[indices]) ** -self.beta
+        return indices, weights / weights.max()
+
+    def update_priorities(self, indices, errors):
+        priorities = np.abs(errors) + 1e-6
+        self.priorities[indices] = priorities
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def batch(self, indices):
+        return self.states[indices], self.actions[indices], self.rewards[indices], self.next_states[indices], self.dones[indices]
+
+
+class ReplayLearner():
+    # Stands in for a Q_learning agent in play_episode(): acting goes
+    # straight through, update() only stores the transition, and every
+    # `learn_every` transitions `updates` batches are replayed into the agent.
+    def __init__(self, agent, buffer, batch_size=64, learn_every=4, updates=1):
+        self.agent = agent
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.learn_every = learn_every
+        self.updates = updates
+        self.steps = 0
+
+    def __getattr__(self, name):
+        # only for names the learner doesn't have; "agent" itself is
+        # missing while unpickling, before __dict__ is filled in
+        if name == "agent":
+            raise AttributeError(name)
+
+        return getattr(self.agent, name)
+
+    def update(self, old_state, new_state, reward, action):
+        self.agent.episode_reward += reward
+
+        # the buffer stores the fields, not packed keys
+        if type(old_state) is int:
+            old_state = unpack_state(old_state)
+        if type(new_state) is int:
+            new_state = unpack_state(new_state)
+
+        self.buffer.add(old_state, action, reward, new_state)
+        self.steps += 1
+
+        if self.steps % self.learn_every == 0 and len(self.buffer) >= self.batch_size:
+            self.learn()
+
+    def learn(self):
+        for i in range(self.updates):
+            indices, weights = self.buffer.sample(self.batch_size)
+            errors = self.agent.update_batch(*self.buffer.batch(indices), weights)
+
+            if self.buffer.prioritized:
+                self.buffer.update_priorities(indices, errors)
+
+    def end_episode(self):
+        self.buffer.mark_done()
@@ -0,0 +1,281 @@
+import numpy as np
+
+from physics import WIDTH, HEIGHT, PADDLE_HEIGHT, BALL_RADIUS
+
+# How far past the walls the ball shows up in states. It overshoots the goal
+# lines by a frame before the point resets it, and gets pushed past the top
+# and bottom by paddle corner hits (models/ has ball y down to -120).
+BALL_X_MARGIN = BALL_RADIUS * 4
+BALL_Y_MARGIN = HEIGHT // 4
+
+# pixels per state bin
+BIN_SIZE = 10
+
+
+class StateEncoder():
+    # Maps a create_state tuple to one flat integer in [0, n_states).
+    #
+    # (paddle y, paddle y - ball y, ball x, ball y, sign Vx, sign Vy)
+    #
+    # The second field is almost redundant: round(a - b) is always within 1 of
+    # round(a) - round(b), so only that -1/0/1 residual gets stored. Values
+    # outside the ranges below are clipped to the nearest edge.
+    def __init__(self, bin_size=BIN_SIZE):
+        self.bin_size = bin_size
+
+        self.paddle_range = (0, round((HEIGHT - PADDLE_HEIGHT) / bin_size))
+        self.residual_range = (-1, 1)
+        self.ball_x_range = (round(-BALL_X_MARGIN / bin_size), round((WIDTH + BALL_X_MARGIN) / bin_size))
+        self.ball_y_range = (round(-BALL_Y_MARGIN / bin_size), round((HEIGHT + BALL_Y_MARGIN) / bin_size))
+
+        self.sizes = (
+            self.paddle_range[1] - self.paddle_range[0] + 1,
+            3,
+            self.ball_x_range[1] - self.ball_x_range[0] + 1,
+            self.ball_y_range[1] - self.ball_y_range[0] + 1,
+            2,
+            2,
+        )
+
+        self.n_states = 1
+        for size in self.sizes:
+            self.n_states *= size
+
+        # index = sum(field * stride) + offset, fields in the order above
+        self.strides = []
+        stride = 1
+        for size in reversed(self.sizes):
+            self.strides.insert(0, stride)
+            stride *= size
+
+        self.offset = (
+            -self.paddle_range[0] * self.strides[0]
+            + self.strides[1]
+            - self.ball_x_range[0] * self.strides[2]
+            - self.ball_y_range[0] * self.strides[3]
+        )
+
+    def encode(self, state):
+        if type(state) is int:
+            # a pack_state() key: the fields straight out of its bits
+            sign_y = state & 1
+            sign_x = state & 2
+            ball_y = ((state >> 2) & FIELD_MASK) - FIELD_OFFSET
+            ball_x = ((state >> (FIELD_BITS + 2)) & FIELD_MASK) - FIELD_OFFSET
+            delta = ((state >> (2 * FIELD_BITS + 2)) & FIELD_MASK) - FIELD_OFFSET
+            p_y = (state >> (3 * FIELD_BITS + 2)) - FIELD_OFFSET
+        else:
+            p_y, delta, ball_x, ball_y, sign_x, sign_y = state
+
+        residual = delta - p_y + ball_y
+        if residual < -1: residual = -1
+        elif residual > 1: residual = 1
+
+        lo, hi = self.paddle_range
+        if p_y < lo: p_y = lo
+        elif p_y > hi: p_y = hi
+        lo, hi = self.ball_x_range
+        if ball_x < lo: ball_x = lo
+        elif ball_x > hi: ball_x = hi
+        lo, hi = self.ball_y_range
+        if ball_y < lo: ball_y = lo
+        elif ball_y > hi: ball_y = hi
+
+        s0, s1, s2, s3, s4, s5 = self.strides
+        return (
+            p_y * s0 + residual * s1 + ball_x * s2 + ball_y * s3
+            + (s4 if sign_x > 0 else 0) + (1 if sign_y > 0 else 0) + self.offset
+        )
+
+    def encode_many(self, states):
+        states = np.asarray(states, dtype=np.int64)
+        p_y, delta, ball_x, ball_y, sign_x, sign_y = states.T
+
+        residual = np.clip(delta - (p_y - ball_y), -1, 1)
+        p_y = np.clip(p_y, *self.paddle_range)
+        ball_x = np.clip(ball_x, *self.ball_x_range)
+        ball_y = np.clip(ball_y, *self.ball_y_range)
+
+        index = p_y - self.paddle_range[0]
+        index = index * 3 + residual + 1
+        index = index * self.sizes[2] + ball_x - self.ball_x_range[0]
+        index = index * self.sizes[3] + ball_y - self.ball_y_range[0]
+        index = index * 2 + (sign_x > 0)
+        index = index * 2 + (sign_y > 0)
+
+        return index
+
+    def decode(self, index):
+        index, sign_y = divmod(index, 2)
+        index, sign_x = divmod(index, 2)
+        index, ball_y = divmod(index, self.sizes[3])
+        index, ball_x = divmod(index, self.sizes[2])
+        p_y, residual = divmod(index, 3)
+
+        p_y += self.paddle_range[0]
+        ball_x += self.ball_x_range[0]
+        ball_y += self.ball_y_range[0]
+
+        return (
+            p_y,
+            p_y - ball_y + residual - 1,
+            ball_x,
+            ball_y,
+            1 if sign_x else -1,
+            1 if sign_y else -1,
+        )
+
+
+# Packed keys: the four position fields as 12-bit offset integers, then the
+# two signs as one bit each, in one int that fits an int64. Used wherever a
+# state has to be a single sortable number (model files).
+FIELD_BITS = 12
+FIELD_OFFSET = 1 << (FIELD_BITS - 1)
+FIELD_MASK = (1 << FIELD_BITS) - 1
+# where the two paddle fields start
+PADDLE_SHIFT = 2 * FIELD_BITS + 2
+
+
+def can_pack(state):
+    return (
+        len(state) == 6
+        and all(type(v) is int and -FIELD_OFFSET <= v < FIELD_OFFSET for v in state[:4])
+        and all(v in (-1, 1) for v in state[4:])
+    )
+
+
+def int_state(state):
+    # Some old models stored create_state fields as integral floats
+    # ((14.0, 14.0, 25.0, 20.0, 1, 1)), which == matched the int states
+    # lookups make. -> the state with those as ints; anything else unchanged
+    if all(isinstance(v, (int, float)) and float(v).is_integer() for v in state):
+        return tuple(int(v) for v in state)
+
+    return state
+
+
+def pack_state(state):
+    p_y, delta, ball_x, ball_y, sign_x, sign_y = state
+
+    key = p_y + FIELD_OFFSET
+    key = (key << FIELD_BITS) | (delta + FIELD_OFFSET)
+    key = (key << FIELD_BITS) | (ball_x + FIELD_OFFSET)
+    key = (key << FIELD_BITS) | (ball_y + FIELD_OFFSET)
+    key = (key << 1) | (sign_x > 0)
+    key = (key << 1) | (sign_y > 0)
+
+    return key
+
+
+def unpack_state(key):
+    sign_y = 1 if key & 1 else -1
+    sign_x = 1 if key & 2 else -1
+    key >>= 2
+
+    ball_y = (key & FIELD_MASK) - FIELD_OFFSET
+    ball_x = ((key >> FIELD_BITS) & FIELD_MASK) - FIELD_OFFSET
+    delta = ((key >> 2 * FIELD_BITS) & FIELD_MASK) - FIELD_OFFSET
+    p_y = ((key >> 3 * FIELD_BITS) & FIELD_MASK) - FIELD_OFFSET
+
+    return (p_y, delta, ball_x, ball_y, sign_x, sign_y)
+
+
+def state_key(state):
+    # a create_state tuple, or a key pack_state() already made -> the key.
+    # Callers that look a state up more than once pack it once and pass
+    # the key around; the Q-tables take either.
+    return state if type(state) is int else pack_state(state)
+
+
+def pack_many(states):
+    states = np.asarray(states, dtype=np.int64)
+
+    keys = states[:, 0] + FIELD_OFFSET
+    for field in range(1, 4):
+        keys = (keys << FIELD_BITS) | (states[:, field] + FIELD_OFFSET)
+
+    keys = (keys << 1) | (states[:, 4] > 0)
+    keys = (keys << 1) | (states[:, 5] > 0)
+
+    return keys
+
+
+def unpack_many(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    states = np.empty((len(keys), 6), dtype=np.int64)
+
+    states[:, 5] = np.where(keys & 1, 1, -1)
+    states[:, 4] = np.where(keys & 2, 1, -1)
+    keys = keys >> 2
+
+    for field in range(3, -1, -1):
+        states[:, field] = (keys & FIELD_MASK) - FIELD_OFFSET
+        keys = keys >> FIELD_BITS
+
+    return states
+
+
+def discretize(val, bin_size):
+    return round(val / bin_size)
+
+
+def create_state(p, opp, ball, bin_size=BIN_SIZE):
+    # p's view of the game: (paddle y, paddle y - ball y, ball x, ball y,
+    # sign Vx, sign Vy), positions in bins
+    return (
+        discretize(p.y, bin_size),
+        discretize(p.y - ball.y, bin_size),
+        discretize(ball.x, bin_size),
+        discretize(ball.y, bin_size),
+        1 if ball.Vx > 0 else -1,
+        1 if ball.Vy > 0 else -1,
+    )
+
+
+class PairEncoder():
+    # create_state for both paddles at once. The ball's four fields are the
+    # same in both views, so they are worked out once per frame, and keys()
+    # builds the pack_state() keys straight from the positions without
+    # going through tuples.
+    #
+    # right_bin_size: bin the right paddle's view differently, for two
+    # models trained on different bin sizes playing each other
+    def __init__(self, bin_size=BIN_SIZE, right_bin_size=None):
+        self.bin_size = bin_size
+        self.right_bin_size = right_bin_size or bin_size
+
+        if self.right_bin_size != bin_size:
+            self.keys = self.mixed_keys
+            self.states = self.mixed_states
+
+    def keys(self, p1, p2, ball):
+        # -> (pack_state(create_state(p1, p2, ball)), pack_state(create_state(p2, p1, ball)))
+        b = self.bin_size
+        ball_y = ball.y
+
+        # the low bits of both keys: ball x, ball y and the two signs
+        low = (((round(ball.x / b) + FIELD_OFFSET) << FIELD_BITS | (round(ball_y / b) + FIELD_OFFSET)) << 2
+               | (2 if ball.Vx > 0 else 0) | (1 if ball.Vy > 0 else 0))
+
+        return (
+            ((round(p1.y / b) + FIELD_OFFSET) << FIELD_BITS | (round((p1.y - ball_y) / b) + FIELD_OFFSET)) << PADDLE_SHIFT | low,
+            ((round(p2.y / b) + FIELD_OFFSET) << FIELD_BITS | (round((p2.y - ball_y) / b) + FIELD_OFFSET)) << PADDLE_SHIFT | low,
+        )
+
+    def states(self, p1, p2, ball):
+        # -> (create_state(p1, p2, ball), create_state(p2, p1, ball))
+        b = self.bin_size
+        ball_y = ball.y
+        shared = (round(ball.x / b), round(ball_y / b), 1 if ball.Vx > 0 else -1, 1 if ball.Vy > 0 else -1)
+
+        return (
+            (round(p1.y / b), round((p1.y - ball_y) / b)) + shared,
+            (round(p2.y / b), round((p2.y - ball_y) / b)) + shared,
+        )
+
+    def mixed_states(self, p1, p2, ball):
+        return create_state(p1, p2, ball, self.bin_size), create_state(p2, p1, ball, self.right_bin_size)
+
+    def mixed_keys(self, p1, p2, ball):
+        state1, state2 = self.mixed_states(p1, p2, ball)
+        return pack_state(state1), pack_state(state2)
@@ -0,0 +1,241 @@
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+
+from ai import Q_learning, GAME_SPEED, REPEAT_ACTION, derive_seed, play_episode
+from frame_skip import DECISION_INTERVAL, PADDLE_STEPS
+from state import BIN_SIZE
+from tournament import load_policy, play_game
+
+# Hyperparameter sweep: one self-play training run per config, spread over
+# the cores, each run in a process of its own with nothing shared.
+#
+#   python sweep.py --param alpha=0.1,0.3,0.5 --param gamma=0.9,0.99
+#   python sweep.py --param alpha=0.05:0.8 --param bin_size=5,10,20 --samples 20
+#
+# A grid is every combination of the listed values. With --samples, that
+# many configs are drawn instead, each value from its list or uniformly from
+# a lo:hi range. Anything not given keeps the value training uses now.
+#
+# Every run trains from scratch on the same seed. Every `eval_every` games
+# its left agent plays `eval_games` greedy games against the reference model
+# (a right paddle), on the game's dynamics and the same serves for every
+# config; only wins count. Results are ranked by the last evaluation's win
+# rate, and by the training time (evaluation excluded) it took to first
+# reach `threshold`.
+
+DEFAULTS = {
+    "alpha": 0.5,
+    "gamma": 0.9,
+    "epsilon_decay": 0.995,
+    "min_epsilon": 0.05,
+    "bin_size": BIN_SIZE,
+    "speed": GAME_SPEED,
+    "repeat_action": REPEAT_ACTION,
+}
+INT_PARAMS = ("bin_size", "repeat_action")
+REFERENCE_PATH = os.path.join("models", "RIGHT_BEST_MODEL_YET.qtab")
+
+
+def parse_value(name, text):
+    return int(text) if name in INT_PARAMS else float(text)
+
+
+def parse_param(spec):
+    # "alpha=0.1,0.5" -> ("alpha", [0.1, 0.5]); "alpha=0.1:0.5" -> ("alpha", (0.1, 0.5))
+    name, _, values = spec.partition("=")
+    if name not in DEFAULTS:
+        raise ValueError(f"unknown parameter: {name!r} (one of {', '.join(DEFAULTS)})")
+
+    if ":" in values:
+        lo, hi = values.split(":")
+        return name, (parse_value(name, lo), parse_value(name, hi))
+
+    return name, [parse_value(name, v) for v in values.split(",")]
+
+
+def grid_configs(space):
+    names = list(space)
+    for name, values in space.items():
+        if isinstance(values, tuple):
+            raise ValueError(f"{name}: a lo:hi range needs --samples")
+
+    return [{**DEFAULTS, **dict(zip(names, values))} for values in itertools.product(*space.values())]
+
+
+def random_configs(space, samples, seed=0):
+    rng = random.Random(seed)
+    configs = []
+
+    for i in range(samples):
+        config = dict(DEFAULTS)
+        for name, values in space.items():
+            if isinstance(values, list):
+                config[name] = rng.choice(values)
+            elif name in INT_PARAMS:
+                config[name] = rng.randint(*values)
+            else:
+                config[name] = rng.uniform(*values)
+
+        configs.append(config)
+
+    return configs
+
+
+def make_agent(config, seed):
+    agent = Q_learning(config["speed"], alpha=config["alpha"], gamma=config["gamma"], seed=seed, bin_size=config["bin_size"])
+    agent.epsilon_decay = config["epsilon_decay"]
+    agent.min_epsilon = config["min_epsilon"]
+    return agent
+
+
+def evaluate(agent, reference, games, seed, max_frames):
+    # -> the share of the games the agent won; a draw (a game still going
+    # at max_frames) is no win. Every config plays the same benchmark: the
+    # game's own dynamics, whatever speed it trained at. play_game reseeds
+    # both sides' rngs, so the agent's own is put back afterwards
+    rng, epsilon = agent.rng, agent.epsilon
+    agent.epsilon = 0
+
+    wins = 0
+    game = None
+    for g in range(games):
+        game, result = play_game(agent, reference, derive_seed(seed, g), game, DECISION_INTERVAL, PADDLE_STEPS, GAME_SPEED, max_frames)
+        wins += result["winner"] == 1
+
+    agent.rng, agent.epsilon = rng, epsilon
+    return wins / games
+
+
+# each worker loads the reference once
+_reference = None
+
+
+def init_worker(reference_path):
+    global _reference
+    _reference = load_policy(reference_path)
+
+
+def run_config(job):
+    # job: (config index, config, settings) -> (index, result)
+    index, config, settings = job
+    seed = settings["seed"]
+
+    left_q = make_agent(config, derive_seed(seed, "left"))
+    right_q = make_agent(config, derive_seed(seed, "right"))
+
+    history = []
+    train_seconds = 0
+    threshold_seconds = None
+    threshold_games = None
+    game = None
+
+    for i in range(settings["games"]):
+        start = time.perf_counter()
+        game = play_episode(left_q, right_q, seed=derive_seed(seed, i), game=game,
+                            speed=config["speed"], repeat_action=config["repeat_action"], bin_size=config["bin_size"])
+        left_q.decay_epslion()
+        right_q.decay_epslion()
+        train_seconds += time.perf_counter() - start
+
+        if (i + 1) % settings["eval_every"] == 0 or i + 1 == settings["games"]:
+            win_rate = evaluate(left_q, _reference, settings["eval_games"], derive_seed(seed, "eval"), settings["max_frames"])
+            history.append((i + 1, train_seconds, win_rate))
+
+            if threshold_seconds is None and win_rate >= settings["threshold"]:
+                threshold_seconds = train_seconds
+                threshold_games = i + 1
+
+    return index, {
+        "config": config,
+        "win_rate": history[-1][2],
+        "best_win_rate": max(h[2] for h in history),
+        "threshold_seconds": threshold_seconds,
+        "threshold_games": threshold_games,
+        "train_seconds": train_seconds,
+        "q_size": len(left_q.q),
+        "history": history,
+    }
+
+
+def run_sweep(configs, reference_path, games=200, eval_every=50, eval_games=10, threshold=0.5, workers=None, seed=0, max_frames=20000):
+    settings = {"games": games, "eval_every": eval_every, "eval_games": eval_games, "threshold": threshold,
+                "seed": seed, "max_frames": max_frames}
+    jobs = [(i, config, settings) for i, config in enumerate(configs)]
+    results = [None] * len(configs)
+
+    start = time.perf_counter()
+    with mp.Pool(workers or os.cpu_count(), init_worker, (reference_path,)) as pool:
+        # one run a task, handed out as workers free up; runs with big
+        # speeds or bins finish at very different times
+        for done, (index, result) in enumerate(pool.imap_unordered(run_config, jobs), 1):
+            results[index] = result
+            print(f"[{done}/{len(jobs)}] config {index}: win rate {result['win_rate']:.2f}, {result['train_seconds']:.1f}s training")
+
+    return results, time.perf_counter() - start
+
+
+def by_win_rate(results):
+    return sorted(range(len(results)), key=lambda i: (-results[i]["win_rate"], -results[i]["best_win_rate"]))
+
+
+def by_threshold_time(results):
+    # configs that never got there last
+    reached = [i for i in range(len(results)) if results[i]["threshold_seconds"] is not None]
+    return sorted(reached, key=lambda i: results[i]["threshold_seconds"]) + [i for i in by_win_rate(results) if i not in reached]
+
+
+def print_table(title, order, results, names):
+    print(f"\n{title}")
+    header = "  ".join(f"{name:>13}" for name in names)
+    print(f"{'#':>4}  {header}  {'win %':>6}  {'best %':>6}  {'to target':>10}  {'games':>6}  {'train s':>8}")
+
+    for i in order:
+        r = results[i]
+        values = "  ".join(f"{r['config'][name]:>13.6g}" for name in names)
+        target = "-" if r["threshold_seconds"] is None else f"{r['threshold_seconds']:.1f}s"
+        games = "-" if r["threshold_games"] is None else r["threshold_games"]
+        print(f"{i:>4}  {values}  {r['win_rate'] * 100:6.1f}  {r['best_win_rate'] * 100:6.1f}  {target:>10}  {games:>6}  {r['train_seconds']:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES",
+                        help=f"values to try, a,b,c or lo:hi with --samples; NAME is one of {', '.join(DEFAULTS)}")
+    parser.add_argument("--samples", type=int, help="random search: this many configs instead of the full grid")
+    parser.add_argument("--reference", default=REFERENCE_PATH, help="right paddle model every config is evaluated against")
+    parser.add_argument("--games", type=int, default=200, help="training games per config")
+    parser.add_argument("--eval-every", type=int, default=50, help="training games between evaluations")
+    parser.add_argument("--eval-games", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.5, help="the win rate the time-to-target ranking is about")
+    parser.add_argument("--max-frames", type=int, default=20000, help="frames before an evaluation game counts as a draw")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write every result here")
+    args = parser.parse_args()
+
+    try:
+        space = dict(parse_param(spec) for spec in args.param)
+        configs = random_configs(space, args.samples, args.seed) if args.samples else grid_configs(space)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not os.path.exists(args.reference):
+        parser.error(f"no reference model at {args.reference}")
+
+    print(f"{len(configs)} configs, {args.games} games each")
+    results, seconds = run_sweep(configs, args.reference, args.games, args.eval_every, args.eval_games, args.threshold,
+                                 args.workers, args.seed, args.max_frames)
+
+    names = list(space) or ["alpha"]
+    print_table("by final win rate", by_win_rate(results), results, names)
+    print_table(f"by training time to a {args.threshold:.0%} win rate", by_threshold_time(results), results, names)
+    print(f"\n{len(configs)} configs in {seconds:.1f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "seconds": seconds}, f, indent=2)
@@ -0,0 +1,165 @@
+import argparse
+import collections
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+# Training metrics as an append-only JSONL stream, and a dashboard that
+# follows it from another terminal:
+#
+#   python ai.py 10000 --metrics run.jsonl
+#   python telemetry.py run.jsonl --window 100
+#
+# train() hands over one record per episode. The training thread only puts
+# the line on a queue; a background thread does the writing, in batches,
+# so a slow disk never holds up an episode.
+
+
+class MetricsWriter():
+    def __init__(self, path, flush_seconds=1.0):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.lines = queue.SimpleQueue()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+
+    def write(self, record):
+        self.lines.put(json.dumps(record) + "\n")
+
+    def drain(self):
+        lines = []
+        while True:
+            try:
+                lines.append(self.lines.get_nowait())
+            except queue.Empty:
+                return lines
+
+    def writer(self):
+        # appends, so a resumed run carries on the same stream
+        with open(self.path, "a") as f:
+            while not self.closed.wait(self.flush_seconds):
+                lines = self.drain()
+                if lines:
+                    f.write("".join(lines))
+                    f.flush()
+
+            f.write("".join(self.drain()))
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+
+
+def episode_record(episode, game, left_q, right_q, seconds):
+    frames = game.frames
+    return {
+        "episode": episode,
+        "time": time.time(),
+        "winner": game.win(),
+        "left_points": game.p1_points,
+        "right_points": game.p2_points,
+        "frames": frames,
+        "seconds": seconds,
+        "frames_per_sec": frames / seconds if seconds else 0,
+        "left_reward": left_q.episode_reward,
+        "right_reward": right_q.episode_reward,
+        "left_epsilon": left_q.epsilon,
+        "right_epsilon": right_q.epsilon,
+        "left_q_size": len(left_q.q),
+        "right_q_size": len(right_q.q),
+    }
+
+
+def follow(path, poll=0.5):
+    # yields records as they are appended, waiting for the file if needed
+    while not os.path.exists(path):
+        time.sleep(poll)
+
+    with open(path) as f:
+        partial = ""
+        while True:
+            chunk = f.readline()
+            if not chunk:
+                yield None
+                time.sleep(poll)
+                continue
+
+            partial += chunk
+            if partial.endswith("\n"):
+                yield json.loads(partial)
+                partial = ""
+
+
+class Dashboard():
+    # rolling aggregates over the last `window` episodes
+    def __init__(self, window=100):
+        self.recent = collections.deque(maxlen=window)
+        self.episodes = 0
+        self.first_time = None
+
+    def add(self, record):
+        self.recent.append(record)
+        self.episodes += 1
+        if self.first_time is None:
+            self.first_time = record["time"] - record["seconds"]
+
+    def render(self):
+        if not self.recent:
+            return "waiting for the first episode..."
+
+        recent = self.recent
+        n = len(recent)
+        last = recent[-1]
+        mean = lambda key: sum(r[key] for r in recent) / n
+
+        seconds = sum(r["seconds"] for r in recent)
+        frames = sum(r["frames"] for r in recent)
+        elapsed = last["time"] - self.first_time
+
+        rows = [
+            f"episode {last['episode']}  ({self.episodes} seen, {elapsed / 60:.1f} min)",
+            f"last {n} episodes:",
+            f"  win rate         left {sum(r['winner'] == 1 for r in recent) / n:6.1%}   right {sum(r['winner'] == 2 for r in recent) / n:6.1%}",
+            f"  points           left {mean('left_points'):6.2f}   right {mean('right_points'):6.2f}",
+            f"  reward           left {mean('left_reward'):8.2f} right {mean('right_reward'):8.2f}",
+            f"  episode length   {mean('frames'):.0f} frames, {mean('seconds'):.2f}s",
+            f"  throughput       {frames / seconds if seconds else 0:.0f} frames/s, {n / seconds * 3600 if seconds else 0:.0f} episodes/h",
+            "now:",
+            f"  epsilon          left {last['left_epsilon']:.4f}   right {last['right_epsilon']:.4f}",
+            f"  Q-table entries  left {last['left_q_size']}   right {last['right_q_size']}",
+        ]
+        return "\n".join(rows)
+
+
+def run_dashboard(path, window=100, refresh=1.0):
+    dashboard = Dashboard(window)
+    last_draw = 0
+
+    for record in follow(path):
+        if record is not None:
+            dashboard.add(record)
+            # catch up on everything already written before drawing
+            continue
+
+        if time.perf_counter() - last_draw >= refresh:
+            # home the cursor and clear the screen, then draw
+            sys.stdout.write("\x1b[H\x1b[2J" + dashboard.render() + "\n")
+            sys.stdout.flush()
+            last_draw = time.perf_counter()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live view of a training metrics stream")
+    parser.add_argument("path", help="the JSONL file given to ai.py --metrics")
+    parser.add_argument("--window", type=int, default=100, help="episodes in the rolling aggregates")
+    parser.add_argument("--refresh", type=float, default=1.0, help="seconds between redraws")
+    args = parser.parse_args()
+
+    try:
+        run_dashboard(args.path, args.window, args.refresh)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from ai import Q_learning
+from state import pack_many
+
+STATES = np.array([
+    (10, 2, 30, 40, 1, -1),
+    (11, 3, 31, 41, -1, 1),
+    (12, 4, 32, 42, 1, 1),
+    (50, 5, 60, 70, -1, -1),
+])
+
+
+def make_agent(backend):
+    agent = Q_learning(20, backend=backend, seed=0)
+    agent.q.set_q(tuple(STATES[0]), 0, 1.0)
+    agent.q.set_q(tuple(STATES[1]), 1, 0.5)
+    agent.q.set_q(tuple(STATES[2]), 1, -0.25)
+    agent.epsilon = 0.3
+    return agent
+
+
+def encoded(agent, backend):
+    # what each backend takes as a 1-D batch
+    if backend == "dense":
+        return agent.q.encoder.encode_many(STATES)
+
+    return pack_many(STATES)
+
+
+@pytest.mark.parametrize("backend", ["dict", "dense"])
+def test_encoded_states_match_state_arrays(backend):
+    agent = make_agent(backend)
+    keys = encoded(agent, backend)
+    assert keys.ndim == 1
+
+    assert np.array_equal(agent.q.q_values_many(keys), agent.q.q_values_many(STATES))
+    assert np.array_equal(agent.best_future_rewards(keys), agent.best_future_rewards(STATES))
+
+    other = make_agent(backend)
+    assert np.array_equal(agent.choose_actions(STATES), other.choose_actions(keys))
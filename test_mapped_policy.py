@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from ai import Q_learning
+from mapped_policy import MappedPolicy
+
+STATES = [
+    (10, 2, 30, 40, 1, -1),
+    (11, 3, 31, 41, -1, 1),
+    (12, 4, 32, 42, 1, 1),
+    (50, 5, 60, 70, -1, -1),  # not in the table
+]
+
+
+@pytest.mark.parametrize("value_dtype", ["<f8", "<f4", "<f2", "i1"])
+def test_matches_q_learning_with_a_default(tmp_path, value_dtype):
+    agent = Q_learning(20)
+    agent.q.set_q(STATES[0], 0, 1.0)
+    agent.q.set_q(STATES[1], 1, -1.5)
+    agent.q.set_q(STATES[2], 0, 0.25)
+    agent.q.set_q(STATES[2], 1, 0.75)
+    # what prune(merge=True) leaves behind
+    agent.q.default = -0.5
+
+    path = str(tmp_path / "model.qtab")
+    agent.save(path, value_dtype=value_dtype)
+    policy = MappedPolicy(path)
+
+    expected = np.array([agent.q.q_values(state) for state in STATES])
+    tolerance = 0.02 if value_dtype == "i1" else 1e-3
+
+    assert np.allclose([policy.q_values(state) for state in STATES], expected, atol=tolerance)
+    assert np.allclose(policy.q_values_many(np.array(STATES)), expected, atol=tolerance)
+    policy.close()
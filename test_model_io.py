@@ -0,0 +1,59 @@
+import numpy as np
+
+import model_io
+from ai import Q_learning, ACTIONS
+from mapped_policy import MappedPolicy
+from q_table import DictQTable
+from state import pack_state
+
+# has integral float states ((14.0, ...)) among its int ones
+LEGACY_PICKLE = "models/fix_because_the_other_one_is_courpted.pkl"
+
+
+def test_legacy_pickle_round_trips(tmp_path):
+    agent = model_io.load_pickle(LEGACY_PICKLE)
+    path = str(tmp_path / "model.qtab")
+    agent.save(path)
+
+    loaded = Q_learning.load(path)
+    policy = MappedPolicy(path)
+
+    assert len(loaded.q) == len(agent.q)
+    for key, value in agent.q.items():
+        assert type(key) is int
+        assert abs(loaded.q.get_entry(key) - value) <= 1e-5 * max(1, abs(value))
+
+        state, action = divmod(key, len(ACTIONS))
+        assert abs(policy.q_values(state)[action] - value) <= 1e-5 * max(1, abs(value))
+
+    policy.close()
+
+
+def test_integral_float_states_pack():
+    table = DictQTable.from_legacy(ACTIONS, [(((14.0, 14.0, 25.0, 20.0, 1, 1), "down"), 0.5)])
+    assert table.get_q((14, 14, 25, 20, 1, 1), 1) == 0.5
+
+    # a raw (float) keys section
+    keys = table.row_keys(np.array([[14.0, 14.0, 25.0, 20.0, 1.0, 1.0]]))
+    assert keys == [pack_state((14, 14, 25, 20, 1, 1)) * 2 + a for a in range(2)]
+
+
+def test_only_unpackable_rows_stay_raw(tmp_path):
+    agent = Q_learning(20)
+    agent.q.set_q((10, 2, 30, 40, 1, -1), 0, 1.0)
+    agent.q.set_q((12, 4, 32, 42, 1, 1), 1, -0.5)
+    # an old float state, which can't be packed
+    agent.q[agent.q.entry_key((300.2, 300.2, 400, 500, -100, 100), 1)] = 0.75
+
+    path = str(tmp_path / "model.qtab")
+    agent.save(path)
+    header, arrays = model_io.read_sections(path)
+    assert header["key_format"] == "packed"
+    assert (header["rows"], header["raw_rows"]) == (2, 1)
+
+    loaded = Q_learning.load(path)
+    assert dict(loaded.q) == dict(agent.q)
+
+    policy = MappedPolicy(path)
+    assert list(policy.q_values((12, 4, 32, 42, 1, 1))) == [0, -0.5]
+    policy.close()
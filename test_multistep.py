@@ -0,0 +1,66 @@
+import contextlib
+import io
+
+import pytest
+
+from ai import Q_learning, train
+from multistep import NStepLearner, WatkinsLearner
+
+
+def train_quietly(*args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return train(*args, **kwargs)
+
+
+def fresh_agents():
+    return Q_learning(20, seed="0:left"), Q_learning(20, seed="0:right")
+
+
+def test_one_step_settings_agree():
+    # n=1 and lambda=0 are both one-step Q-learning on each step's summed reward
+    left_q, right_q = fresh_agents()
+    nstep = train_quietly(2, left_q=left_q, right_q=right_q, seed=0, multistep=lambda agent: NStepLearner(agent, 1))
+    left_q, right_q = fresh_agents()
+    watkins = train_quietly(2, left_q=left_q, right_q=right_q, seed=0, multistep=lambda agent: WatkinsLearner(agent, 0.0))
+
+    for a, b in zip(nstep, watkins):
+        assert dict(a.q) == pytest.approx(dict(b.q))
+        assert a.q.visits == b.q.visits
+
+
+def play_three_steps(learner):
+    # states are packed keys 1 -> 2 -> 3 -> 4; the first step's reward comes
+    # in two update() calls, as play_episode hands them over
+    actions = []
+    rewards = {1: [1.0, 0.5], 2: [-1.0], 3: [2.0]}
+    for state in (1, 2, 3):
+        action = learner.choose_action(state)
+        for reward in rewards[state]:
+            learner.update(state, state + 1, reward, action)
+        actions.append(action)
+
+    learner.end_episode()
+    q = learner.agent.q
+    return [q.get_q(state, action) for state, action in zip((1, 2, 3), actions)]
+
+
+def greedy_agent():
+    agent = Q_learning(20, alpha=0.5, gamma=0.9, seed=0)
+    agent.epsilon = 0
+    return agent
+
+
+def test_n_step_returns():
+    # n=2, step rewards 1.5, -1, 2, every bootstrap 0:
+    #   Q(1) = 0.5 * (1.5 + 0.9 * -1) = 0.3
+    #   Q(2) = 0.5 * (-1 + 0.9 * 2) = 0.4
+    #   Q(3) = 0.5 * 2 = 1.0 (cut short by the episode's end)
+    assert play_three_steps(NStepLearner(greedy_agent(), 2)) == pytest.approx([0.3, 0.4, 1.0])
+
+
+def test_lambda_returns():
+    # lambda=0.8: traces fade by 0.9 * 0.8 = 0.72 a step; errors 1.5, -1, 2
+    #   Q(1) = 0.5 * (1.5 - 1 * 0.72 + 2 * 0.72 ** 2) = 0.9084
+    #   Q(2) = 0.5 * (-1 + 2 * 0.72) = 0.22
+    #   Q(3) = 0.5 * 2 = 1.0
+    assert play_three_steps(WatkinsLearner(greedy_agent(), 0.8)) == pytest.approx([0.9084, 0.22, 1.0])
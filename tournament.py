@@ -0,0 +1,235 @@
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import model_io
+from ai import Q_learning, GAME_SPEED, derive_seed
+from frame_skip import FrameSkip, DECISION_INTERVAL, PADDLE_STEPS
+from physics import Game, FRAME_DT, make_rng
+from state import PairEncoder
+
+# Round-robin between saved models, headless and greedy.
+#
+#   python tournament.py                      every .qtab in models/
+#   python tournament.py a.qtab b.pkl --games 20 --workers 4
+#
+# Every pair plays `games` games with each model on each side, on the
+# dynamics game.py plays with (frame_skip.FrameSkip). Each game has its own
+# seed, for the serves and for the models' tie-breaks, so the results don't
+# depend on how the games were spread over the workers. A game nobody has
+# won after `max_frames` frames is a draw.
+
+ELO_START = 1500
+ELO_K = 16
+
+
+def model_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def raw_keyed(path):
+    # a .qtab holding old float states (model_io's raw keys): the game's
+    # states never look those up, so the model would play at random
+    if not path.endswith(".qtab"):
+        return False
+
+    with open(path, "rb") as f:
+        header = model_io.read_header(f)
+
+    return header["key_format"] == "raw" or header.get("raw_rows", 0) > 0
+
+
+def load_policy(path):
+    # epsilon off: the model's best action every time
+    if raw_keyed(path):
+        raise ValueError(f"{path}: an old float-state model, which can't play the current game's states")
+
+    if path.endswith(".npz"):
+        from approx import load_agent
+        agent = load_agent(path)
+    else:
+        agent = model_io.load_pickle(path) if path.endswith(".pkl") else Q_learning.load(path)
+    agent.epsilon = 0
+    return agent
+
+
+# each worker loads every model once, then plays whatever games it is sent
+_policies = None
+_settings = None
+
+
+def init_worker(paths, settings):
+    global _policies, _settings
+    _policies = [load_policy(path) for path in paths]
+    _settings = settings
+
+
+def play_game(left, right, seed, game=None, skip=DECISION_INTERVAL, paddle_steps=PADDLE_STEPS, speed=GAME_SPEED, max_frames=200000):
+    # -> (game, {"winner": 1, 2 or 0 for a draw, "points": (left, right),
+    #            "hits": (left, right), "frames": n})
+    if game is None:
+        game = Game(speed, FRAME_DT, seed)
+    else:
+        game.reset(seed)
+
+    left.rng = make_rng(derive_seed(seed, "left"))
+    right.rng = make_rng(derive_seed(seed, "right"))
+
+    # each model sees the game in the bins it was trained on
+    env = FrameSkip(game, skip, paddle_steps, packed=True, encoder=PairEncoder(left.bin_size, right.bin_size))
+    state1, state2 = env.observe()
+    hits = [0, 0]
+
+    while not game.win() and game.frames < max_frames:
+        state1, state2, hit, side = env.step(left.choose_action(state1), right.choose_action(state2))
+        if hit:
+            hits[hit - 1] += 1
+
+        if side:
+            state1, state2 = env.observe()
+
+    return game, {"winner": game.win(), "points": (game.p1_points, game.p2_points), "hits": tuple(hits), "frames": game.frames}
+
+
+def play_match(job):
+    # job: (left model index, right model index, first seed, games)
+    i, j, seed, games = job
+    left, right = _policies[i], _policies[j]
+    results = []
+    game = None
+
+    for g in range(games):
+        game, result = play_game(left, right, derive_seed(seed, g), game, **_settings)
+        results.append(result)
+
+    return i, j, results
+
+
+def make_jobs(n_models, games, seed):
+    # both orders of every pair, so each model plays both sides
+    return [(i, j, derive_seed(seed, f"{i}-{j}"), games) for i, j in itertools.permutations(range(n_models), 2)]
+
+
+def expected_score(rating, other):
+    return 1 / (1 + 10 ** ((other - rating) / 400))
+
+
+def update_elo(ratings, i, j, score):
+    # score: 1 if i won, 0.5 for a draw, 0 if j won
+    expected = expected_score(ratings[i], ratings[j])
+    ratings[i] += ELO_K * (score - expected)
+    ratings[j] -= ELO_K * (score - expected)
+
+
+def summarize(names, matches):
+    # matches: (left, right, results) in job order, so the Elo ratings
+    # come out the same however the jobs were scheduled
+    stats = [{"name": name, "games": 0, "wins": 0, "draws": 0, "points_for": 0, "points_against": 0, "hits": 0, "misses": 0}
+             for name in names]
+    ratings = [ELO_START] * len(names)
+
+    for i, j, results in matches:
+        for result in results:
+            left_points, right_points = result["points"]
+            left_hits, right_hits = result["hits"]
+
+            for side, points_for, points_against, hits in ((i, left_points, right_points, left_hits), (j, right_points, left_points, right_hits)):
+                s = stats[side]
+                s["games"] += 1
+                s["points_for"] += points_for
+                s["points_against"] += points_against
+                s["hits"] += hits
+                # every point conceded is a ball the paddle didn't get to
+                s["misses"] += points_against
+
+            if result["winner"]:
+                score = 1 if result["winner"] == 1 else 0
+                stats[i if score else j]["wins"] += 1
+            else:
+                score = 0.5
+                stats[i]["draws"] += 1
+                stats[j]["draws"] += 1
+
+            update_elo(ratings, i, j, score)
+
+    for s, rating in zip(stats, ratings):
+        games = s["games"] or 1
+        touches = s["hits"] + s["misses"]
+        s["elo"] = rating
+        s["win_rate"] = (s["wins"] + 0.5 * s["draws"]) / games
+        s["points_per_game"] = s["points_for"] / games
+        s["hit_rate"] = s["hits"] / touches if touches else 0
+
+    return sorted(stats, key=lambda s: -s["elo"])
+
+
+def run_tournament(paths, games=10, workers=None, seed=0, max_frames=200000, skip=DECISION_INTERVAL, paddle_steps=PADDLE_STEPS, speed=GAME_SPEED):
+    # -> (standings, {"games", "frames", "seconds"})
+    names = [model_name(path) for path in paths]
+    settings = {"skip": skip, "paddle_steps": paddle_steps, "speed": speed, "max_frames": max_frames}
+    jobs = make_jobs(len(paths), games, seed)
+
+    start = time.perf_counter()
+    with mp.Pool(workers or os.cpu_count(), init_worker, (paths, settings)) as pool:
+        # a match a task: big enough to pay for the round trip, small
+        # enough to keep every worker busy to the end
+        matches = pool.map(play_match, jobs, chunksize=1)
+
+    elapsed = time.perf_counter() - start
+
+    played = sum(len(results) for i, j, results in matches)
+    frames = sum(r["frames"] for i, j, results in matches for r in results)
+    return summarize(names, matches), {"games": played, "frames": frames, "seconds": elapsed}
+
+
+def print_standings(standings, totals):
+    width = max(len(s["name"]) for s in standings)
+    print(f"{'model':<{width}}  {'elo':>6}  {'games':>5}  {'win %':>6}  {'pts/game':>8}  {'hit %':>6}")
+    for s in standings:
+        print(f"{s['name']:<{width}}  {s['elo']:6.0f}  {s['games']:5d}  {s['win_rate'] * 100:6.1f}  "
+              f"{s['points_per_game']:8.2f}  {s['hit_rate'] * 100:6.1f}")
+
+    print(f"\n{totals['games']} games in {totals['seconds']:.1f}s: "
+          f"{totals['games'] / totals['seconds']:.2f} games/s, {totals['frames'] / totals['seconds']:.0f} frames/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round-robin tournament between saved models")
+    parser.add_argument("models", nargs="*", help="model files (.qtab, .pkl or approx.py's .npz); default: every .qtab in models/")
+    parser.add_argument("--games", type=int, default=10, help="games per pair and side")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-frames", type=int, default=200000, help="frames before a game counts as a draw")
+    parser.add_argument("--skip", type=int, default=DECISION_INTERVAL, help="frames per decision")
+    parser.add_argument("--paddle-steps", type=int, default=PADDLE_STEPS)
+    parser.add_argument("--speed", type=float, default=GAME_SPEED)
+    parser.add_argument("--json", help="also write the standings here")
+    args = parser.parse_args()
+
+    paths = args.models
+    if not paths:
+        paths = []
+        for path in sorted(glob.glob(os.path.join("models", "*.qtab"))):
+            if raw_keyed(path):
+                print(f"skipping {path}: old float-state model", file=sys.stderr)
+            else:
+                paths.append(path)
+
+    for path in paths:
+        if raw_keyed(path):
+            parser.error(f"{path} is an old float-state model, which can't play the current game's states")
+
+    if len(paths) < 2:
+        parser.error("need at least two models")
+
+    standings, totals = run_tournament(paths, args.games, args.workers, args.seed, args.max_frames, args.skip, args.paddle_steps, args.speed)
+    print_standings(standings, totals)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"standings": standings, **totals}, f, indent=2)
@@ -0,0 +1,163 @@
+import numpy as np
+
+from physics import WIDTH, HEIGHT, PADDLE_WIDTH, PADDLE_HEIGHT, BALL_RADIUS, POINTS_TO_WIN, LEFT_PADDLE_X, RIGHT_PADDLE_X, PADDLE_START_Y, FRAME_DT, UP, DOWN, STAY
+from state import BIN_SIZE
+
+
+class VecGame():
+    # N independent games of physics.Game stored as arrays. One step() is one
+    # frame for every game: both paddles move, the ball moves and collides
+    # (Ball.update), then points are scored (Game.update_points). Points and
+    # finished games reset themselves so the batch never has to stop; step()
+    # hands back the states seen just before that reset, like train() does.
+    def __init__(self, n, speed, dt=FRAME_DT, repeat_action=1, bin_size=BIN_SIZE, seed=None):
+        self.n = n
+        self.bin_size = bin_size
+        self.dt = dt
+        self.speed = speed * dt
+        self.repeat_action = repeat_action
+        self.points_to_win = POINTS_TO_WIN
+        self.rng = np.random.default_rng(seed)
+
+        self.ball_x = np.empty(n)
+        self.ball_y = np.empty(n)
+        self.ball_Vx = np.empty(n)
+        self.ball_Vy = np.empty(n)
+        self.is_start = np.empty(n, dtype=bool)
+
+        self.p1_y = np.empty(n)
+        self.p2_y = np.empty(n)
+        # pygame.Rect keeps integer positions, collisions use those
+        self.p1_rect_y = np.empty(n, dtype=np.int64)
+        self.p2_rect_y = np.empty(n, dtype=np.int64)
+
+        self.p1_points = np.zeros(n, dtype=np.int64)
+        self.p2_points = np.zeros(n, dtype=np.int64)
+        self.frames = np.zeros(n, dtype=np.int64)
+
+        self.reset()
+
+    def random_directions(self, k):
+        return self.rng.choice((-1.0, 1.0), size=(2, k))
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = np.ones(self.n, dtype=bool)
+
+        k = int(mask.sum())
+        if k == 0:
+            return
+
+        # Ball.__init__ picks a direction, then the first move_ball picks another
+        dx, dy = self.random_directions(k)
+        self.ball_Vx[mask] = self.speed * dx
+        self.ball_Vy[mask] = self.speed * dy
+        self.reset_ball(mask)
+
+        self.p1_y[mask] = PADDLE_START_Y
+        self.p2_y[mask] = PADDLE_START_Y
+        self.p1_rect_y[mask] = PADDLE_START_Y
+        self.p2_rect_y[mask] = PADDLE_START_Y
+
+        self.p1_points[mask] = 0
+        self.p2_points[mask] = 0
+        self.frames[mask] = 0
+
+    def reset_ball(self, mask):
+        self.ball_x[mask] = WIDTH // 2
+        self.ball_y[mask] = HEIGHT // 2
+        self.is_start[mask] = True
+
+    def move_paddles(self, actions1, actions2):
+        dir1 = np.where(actions1 == UP, -1.0, np.where(actions1 == DOWN, 1.0, 0.0))
+        dir2 = np.where(actions2 == UP, -1.0, np.where(actions2 == DOWN, 1.0, 0.0))
+
+        # same per-step clamp as Paddle.move/check_borders
+        for i in range(self.repeat_action):
+            self.p1_y = np.clip(self.p1_y + dir1 * self.speed, 0, HEIGHT - PADDLE_HEIGHT)
+            self.p2_y = np.clip(self.p2_y + dir2 * self.speed, 0, HEIGHT - PADDLE_HEIGHT)
+
+        self.p1_rect_y = self.p1_y.astype(np.int64)
+        self.p2_rect_y = self.p2_y.astype(np.int64)
+
+    def move_ball(self):
+        start = self.is_start
+        k = int(start.sum())
+        if k:
+            dx, dy = self.random_directions(k)
+            self.ball_Vx[start] *= dx
+            self.ball_Vy[start] *= dy
+            self.is_start[:] = False
+
+        self.ball_x += self.ball_Vx
+        self.ball_y += self.ball_Vy
+
+    def check_collisions(self):
+        x, y = self.ball_x, self.ball_y
+
+        wall = (y <= 0) | (y >= HEIGHT)
+        self.ball_Vy[wall] *= -1
+
+        paddle_hit = np.zeros(self.n, dtype=np.int64)
+        for player, rect_x, rect_y in ((1, LEFT_PADDLE_X, self.p1_rect_y), (2, RIGHT_PADDLE_X, self.p2_rect_y)):
+            near_x = np.clip(x, rect_x, rect_x + PADDLE_WIDTH)
+            near_y = np.clip(y, rect_y, rect_y + PADDLE_HEIGHT)
+
+            # Ball.check_collisions returns on the first paddle it touches
+            hit = (np.hypot(near_x - x, near_y - y) <= BALL_RADIUS) & (paddle_hit == 0)
+            edge = (y <= rect_y) | (y >= rect_y + PADDLE_HEIGHT)
+
+            self.ball_Vy[hit & edge] *= -1
+            self.ball_Vx[hit & ~edge] *= -1
+            paddle_hit[hit] = player
+
+        return paddle_hit
+
+    def did_hit_sides(self):
+        side = np.zeros(self.n, dtype=np.int64)
+        side[self.ball_x <= -(BALL_RADIUS * 2)] = -1
+        side[self.ball_x >= WIDTH + BALL_RADIUS * 2] = 1
+        return side
+
+    def win(self):
+        winner = np.zeros(self.n, dtype=np.int64)
+        winner[self.p1_points == self.points_to_win] = 1
+        winner[self.p2_points == self.points_to_win] = 2
+        return winner
+
+    def step(self, actions1, actions2):
+        self.move_paddles(np.asarray(actions1), np.asarray(actions2))
+        self.move_ball()
+        paddle_hit = self.check_collisions()
+        states1, states2 = self.states()
+
+        side = self.did_hit_sides()
+        self.p2_points[side == -1] += 1
+        self.p1_points[side == 1] += 1
+        self.reset_ball(side != 0)
+        self.frames += 1
+
+        winner = self.win()
+        self.reset(winner != 0)
+
+        return states1, states2, paddle_hit, side, winner
+
+    def states(self):
+        # create_state(p1, p2, ball) and create_state(p2, p1, ball) for every game
+        bin_size = self.bin_size
+        ball_x = np.round(self.ball_x / bin_size)
+        ball_y = np.round(self.ball_y / bin_size)
+        sign_x = np.where(self.ball_Vx > 0, 1, -1)
+        sign_y = np.where(self.ball_Vy > 0, 1, -1)
+
+        def view(p_y):
+            return np.stack((
+                np.round(p_y / bin_size),
+                np.round((p_y - self.ball_y) / bin_size),
+                ball_x,
+                ball_y,
+                sign_x,
+                sign_y,
+            ), axis=1).astype(np.int64)
+
+        return view(self.p1_y), view(self.p2_y)